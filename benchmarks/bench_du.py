@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from prettytable import PrettyTable
+
+from validator import amms, du, instance_collect, profiling, tokens, web3
+from validator.http_client import close_session
+from validator.replay import FixtureStore, parse_latencies, start_replay_servers, stop_replay_servers
+from validator.scheduler import close_solve_scheduler
+
+
+async def reset_state():
+    """Drops all in-memory caches and clients, so every run starts cold."""
+    await close_solve_scheduler()
+    await close_session()
+    du.solve_results.entries.clear()
+    web3.call_results.clear()
+    amms._liquidity_store = None
+    tokens._token_store = None
+    instance_collect.orderbook_has_bulk_lookup = True
+
+
+async def timed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return time.perf_counter() - start, result
+
+
+async def bench_auction(auction_id_or_txhash, repeat, prune_hops):
+    """Returns the median cold run times of fetching the auction and of computing its
+    disregarded utility end to end, and the fetched instance."""
+    fetch_times, du_times = [], []
+    for _ in range(repeat):
+        await reset_state()
+        fetch_time, (instance, _) = await timed(
+            instance_collect.fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook=True)
+        )
+        fetch_times.append(fetch_time)
+        await reset_state()
+        du_time, _ = await timed(
+            du.compute_auction_disregarded_utility_info(auction_id_or_txhash, True, None, prune_hops)
+        )
+        du_times.append(du_time)
+    return statistics.median(fetch_times), statistics.median(du_times), instance
+
+
+async def bench_batch(auction_ids_or_txhashes, concurrency, prune_hops):
+    await reset_state()
+    start = time.perf_counter()
+    nr_errors = 0
+    results = du.compute_batch_disregarded_utility_info(auction_ids_or_txhashes, True, concurrency, prune_hops)
+    async for _, _, _, _, error in results:
+        nr_errors += error is not None
+    return time.perf_counter() - start, nr_errors
+
+
+async def main(fixture_dir, latencies, jitter, solver_concurrencies, batch_concurrencies, repeat, prune_hops, profile):
+    auction_ids_or_txhashes = [a['auction_id_or_txhash'] for a in json.loads((fixture_dir / 'auctions.json').read_text())]
+    runners, urls = await start_replay_servers(FixtureStore(fixture_dir), latencies, jitter)
+    os.environ.update(urls)
+    os.environ['TOKEN_METADATA_DUMP'] = str(fixture_dir / 'tokens.json')
+
+    try:
+        tab = PrettyTable(['Auction', 'Orders', 'AMMs', 'Solver concurrency', 'Fetch (s)', 'DU (s)', 'Orders/s'])
+        for solver_concurrency in solver_concurrencies:
+            os.environ['SOLVER_CONCURRENCY'] = str(solver_concurrency)
+            profiler = profiling.enable_profiling() if profile else None
+            for auction_id_or_txhash in auction_ids_or_txhashes:
+                fetch_time, du_time, instance = await bench_auction(auction_id_or_txhash, repeat, prune_hops)
+                nr_orders = len(instance['orders'])
+                tab.add_row([
+                    auction_id_or_txhash, nr_orders, len(instance['amms']), solver_concurrency,
+                    f'{fetch_time:.4f}', f'{du_time:.4f}', f'{nr_orders / du_time:.2f}'
+                ])
+            if profiler is not None:
+                print(f'Stages with solver concurrency {solver_concurrency}:', file=sys.stderr)
+                profiler.print_report()
+        tab.sortby = 'Orders'
+        print(tab)
+
+        tab = PrettyTable(['Auctions', 'Batch concurrency', 'Total (s)', 'Auctions/s', 'Errors'])
+        for concurrency in batch_concurrencies:
+            total_time, nr_errors = await bench_batch(auction_ids_or_txhashes, concurrency, prune_hops)
+            tab.add_row([
+                len(auction_ids_or_txhashes), concurrency, f'{total_time:.4f}',
+                f'{len(auction_ids_or_txhashes) / total_time:.2f}', nr_errors
+            ])
+        print(tab)
+    finally:
+        await reset_state()
+        await stop_replay_servers(runners)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark instance collection and disregarded utility computation against recorded responses."
+    )
+
+    parser.add_argument(
+        'fixture_dir',
+        type=Path,
+        help="Directory recorded with `python -m validator.replay record`."
+    )
+
+    parser.add_argument(
+        '--latency',
+        action='append',
+        default=[],
+        metavar='SERVICE=SECONDS',
+        help="Delay responses of a service (orderbook, lpbook, quasimodo, rpc). Can be repeated."
+    )
+
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0,
+        help="Add up to this many seconds of random delay to every response."
+    )
+
+    parser.add_argument(
+        '--solver_concurrency',
+        type=int,
+        nargs='+',
+        default=[1, 8],
+        help="SOLVER_CONCURRENCY values to benchmark single auctions with."
+    )
+
+    parser.add_argument(
+        '--batch_concurrency',
+        type=int,
+        nargs='+',
+        default=[1, 4],
+        help="Numbers of auctions processed concurrently to benchmark batch mode with."
+    )
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help="Report the median of this many runs per auction."
+    )
+
+    parser.add_argument(
+        '--prune_hops',
+        type=int,
+        default=du.DEFAULT_PRUNE_HOPS,
+        help="Only send the solver amms reachable from an order's tokens within this many hops. Negative values disable pruning."
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Print the per stage breakdown of every solver concurrency setting."
+    )
+
+    args = parser.parse_args()
+
+    # Results must come from the stand-ins, not from earlier runs, and Dune is not replayed.
+    os.environ['VALIDATOR_CACHE_PATH'] = ''
+    os.environ['DATA_SOURCES'] = 'rpc'
+
+    asyncio.run(main(
+        args.fixture_dir, parse_latencies(args.latency), args.jitter, args.solver_concurrency,
+        args.batch_concurrency, args.repeat, args.prune_hops, args.profile
+    ))
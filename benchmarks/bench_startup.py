@@ -0,0 +1,89 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from prettytable import PrettyTable
+
+# Commands a short-lived invocation or a worker process starts with.
+DEFAULT_COMMANDS = [
+    'import validator.du',
+    'import validator.instance_collect',
+    'import validator.follower',
+    'import validator.backfill',
+    '-m validator.du --help',
+    '-m validator.backfill --help',
+]
+
+
+def run_time(command):
+    """Wall time of a fresh interpreter running `command`: either python arguments
+    starting with -m, or a statement passed to -c."""
+    args = command.split() if command.startswith('-m ') else ['-c', command]
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_time_by_module(command, top):
+    """Top modules by cumulative import time of `command`, from python -X importtime."""
+    args = command.split() if command.startswith('-m ') else ['-c', command]
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        if not module.startswith(' ' * 2):
+            times.append((int(cumulative) / 1e6, module.strip()))
+    return sorted(times, reverse=True)[:top]
+
+
+def main(commands, repeat, top):
+    tab = PrettyTable(['Command', 'Median (s)', 'Min (s)', 'Max (s)'])
+    for command in commands:
+        times = [run_time(command) for _ in range(repeat)]
+        tab.add_row([command, f'{statistics.median(times):.4f}', f'{min(times):.4f}', f'{max(times):.4f}'])
+    print(tab)
+
+    if top > 0:
+        for command in commands:
+            tab = PrettyTable(['Top level import', 'Cumulative (s)'])
+            tab.add_rows([[module, f'{seconds:.4f}'] for seconds, module in import_time_by_module(command, top)])
+            print(command)
+            print(tab)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the startup time of the validator's entry points in fresh interpreters."
+    )
+
+    parser.add_argument(
+        'commands',
+        type=str,
+        nargs='*',
+        default=DEFAULT_COMMANDS,
+        help="Statements to run with python -c, or '-m module args' (default: importing and --help of the entry points)."
+    )
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=10,
+        help="Report the median of this many runs per command."
+    )
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=0,
+        help="Also list this many slowest top level imports per command, from python -X importtime."
+    )
+
+    args = parser.parse_args()
+
+    main(args.commands, args.repeat, args.top)
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+import pytest
+
+from validator import amms, cache, du, instance_collect, tokens
+from validator.common import NATIVE_TOKEN
+
+# Recorded with `python -m validator.replay record` against stand-ins of the services:
+# auction 1000 settles one order selling 1 WETH for 1000 USDC (limit 900 USDC), and the
+# solver finds 1010 USDC for it.
+FIXTURE_DIR = Path(__file__).parent / 'fixtures' / 'replay'
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    """Process-wide stores and caches are reset, so nothing leaks between tests."""
+    monkeypatch.setenv('VALIDATOR_CACHE_PATH', '')
+    monkeypatch.setenv('DATA_SOURCES', 'rpc')
+    monkeypatch.setenv('TOKEN_METADATA_DUMP', str(FIXTURE_DIR / 'tokens.json'))
+    monkeypatch.setenv('BASE_TOKENS', NATIVE_TOKEN)
+    monkeypatch.setattr(cache, '_cache', cache.MISSING)
+    monkeypatch.setattr(tokens, '_token_store', None)
+    monkeypatch.setattr(amms, '_liquidity_store', None)
+    monkeypatch.setattr(instance_collect, 'orderbook_has_bulk_lookup', True)
+    monkeypatch.setattr(du, 'solve_results', cache.LruCache(16, name='solve'))
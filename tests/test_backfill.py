@@ -0,0 +1,63 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from validator.backfill import backfill_shard, split_evenly
+from validator.replay import FixtureStore, start_replay_servers, stop_replay_servers
+
+# See tests/conftest.py.
+FIXTURE_DIR = Path(__file__).parent / 'fixtures' / 'replay'
+
+
+async def backfill(monkeypatch, auction_ids, output_dir, **env):
+    runners, urls = await start_replay_servers(FixtureStore(FIXTURE_DIR))
+    for env_var, url in {**urls, **env}.items():
+        monkeypatch.setenv(env_var, url)
+    try:
+        return await backfill_shard(auction_ids, output_dir, True, 2, 2, 2)
+    finally:
+        await stop_replay_servers(runners)
+
+
+def test_backfill_shard(fresh_state, monkeypatch, tmp_path):
+    # Auction 1001 has no recorded solver competition, the orderbook answers 404.
+    stats = asyncio.run(backfill(monkeypatch, [1000, 1001], tmp_path))
+
+    assert stats['completed'] == 1
+    assert stats['no_competition'] == 1
+    assert stats['failed'] == 0
+    (record,) = [json.loads(line) for line in (tmp_path / '1000.jsonl').read_text().splitlines()]
+    assert record['du'] == 10 * 10**6
+    assert (tmp_path / '1001.jsonl').read_text() == ''
+
+
+def test_backfill_shard_failures_are_retried(fresh_state, monkeypatch, tmp_path):
+    # LPBook is unreachable: only a missing solver competition means there is nothing to
+    # compute, so the auction gets no result file and the next run retries it.
+    stats = asyncio.run(backfill(monkeypatch, [1000], tmp_path, LPBOOK_URL='http://127.0.0.1:9', HTTP_RETRIES='0'))
+
+    assert stats['failed'] == 1
+    assert stats['no_competition'] == 0
+    assert not (tmp_path / '1000.jsonl').exists()
+
+
+
+def test_backfill_shard_survives_orderbook_outage(fresh_state, monkeypatch, tmp_path):
+    stats = asyncio.run(backfill(
+        monkeypatch, [1000, 1001, 1002], tmp_path, ORDERBOOK_URL='http://127.0.0.1:9', HTTP_RETRIES='0'
+    ))
+
+    assert stats['failed'] == 3
+    assert stats['no_competition'] == 0
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('total, parts, expected', [
+    (16, 4, [4, 4, 4, 4]),
+    (10, 4, [3, 3, 2, 2]),
+    (3, 3, [1, 1, 1]),
+])
+def test_split_evenly(total, parts, expected):
+    assert split_evenly(total, parts) == expected
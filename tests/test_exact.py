@@ -0,0 +1,153 @@
+import math
+from fractions import Fraction
+
+import pytest
+
+from validator.common import NATIVE_TOKEN
+from validator.exact import (ROUND_DOWN, ROUND_HALF_EVEN, ROUND_UP, create_token_valuation_table, mul_div,
+                             order_disregarded_utility, order_surplus, percentage, round_fraction)
+from validator.records import Execution, Order
+
+SELL_TOKEN = '0x' + '1' * 40
+BUY_TOKEN = '0x' + '2' * 40
+
+
+def create_order(sell_amount, buy_amount, is_sell_order):
+    return Order(
+        sell_token=SELL_TOKEN, buy_token=BUY_TOKEN, sell_amount=sell_amount, buy_amount=buy_amount,
+        is_sell_order=is_sell_order, is_liquidity_order=False, allow_partial_fill=False,
+        fee_amount=0, fee_token=SELL_TOKEN, cost_amount=0, cost_token=NATIVE_TOKEN,
+        mandatory=False, has_atomic_execution=False,
+    )
+
+
+@pytest.mark.parametrize('a, b, c, rounding, expected', [
+    (7, 3, 2, ROUND_DOWN, 10),
+    (7, 3, 2, ROUND_UP, 11),
+    (7, 3, 2, ROUND_HALF_EVEN, 10),   # 10.5 rounds to the even 10
+    (5, 3, 2, ROUND_HALF_EVEN, 8),    # 7.5 rounds to the even 8
+    (10, 1, 3, ROUND_HALF_EVEN, 3),   # 3.33...
+    (20, 1, 3, ROUND_HALF_EVEN, 7),   # 6.66...
+    (6, 2, 3, ROUND_UP, 4),           # exact results are never rounded
+    (-7, 1, 2, ROUND_DOWN, -4),       # floor, not truncation
+    (-7, 1, 2, ROUND_UP, -3),
+])
+def test_mul_div_rounding(a, b, c, rounding, expected):
+    assert mul_div(a, b, c, rounding) == expected
+
+
+def test_mul_div_beyond_64_bits():
+    assert mul_div(3 * 10**40, 10**40, 3) == 10**80
+    assert mul_div(10**40 + 1, 1, 2, ROUND_UP) == 5 * 10**39 + 1
+
+
+def test_mul_div_unknown_rounding():
+    with pytest.raises(ValueError):
+        mul_div(7, 1, 2, 'nearest')
+
+
+def test_round_fraction():
+    assert round_fraction(Fraction(5, 2)) == 2
+    assert round_fraction(Fraction(7, 2)) == 4
+    assert round_fraction(Fraction(7, 2), ROUND_DOWN) == 3
+    assert round_fraction(Fraction(-1, 3)) == 0
+
+
+def test_sell_order_surplus():
+    o = create_order(sell_amount=100, buy_amount=200, is_sell_order=True)
+    assert order_surplus(o, Execution(100, 250)) == (BUY_TOKEN, 50)
+    # Partial fill: the limit price is pro-rated.
+    assert order_surplus(o, Execution(50, 120)) == (BUY_TOKEN, 20)
+    assert order_surplus(o, Execution(3, 7)) == (BUY_TOKEN, 1)
+    assert order_surplus(o, None) == (BUY_TOKEN, 0)
+
+
+def test_buy_order_surplus():
+    o = create_order(sell_amount=100, buy_amount=200, is_sell_order=False)
+    assert order_surplus(o, Execution(80, 200)) == (SELL_TOKEN, 20)
+    assert order_surplus(o, Execution(45, 100)) == (SELL_TOKEN, 5)
+    assert order_surplus(o, Execution(1, 3)) == (SELL_TOKEN, Fraction(1, 2))
+    assert order_surplus(o, None) == (SELL_TOKEN, 0)
+
+
+@pytest.mark.parametrize('eo_s, eo_f, expected', [
+    (Execution(100, 250), Execution(100, 260), 10),
+    (Execution(100, 250), Execution(100, 250), 0),
+    # The part not covered by eo_f is valued at the submitted rate: 40 * 2.5 + 160 - 250.
+    (Execution(100, 250), Execution(60, 160), 10),
+    (Execution(3, 10), Execution(1, 4), Fraction(2, 3)),
+    (Execution(100, 250), None, 0),
+    (None, Execution(100, 260), 260),
+    # A worse execution is negative disregarded utility.
+    (Execution(100, 250), Execution(100, 240), -10),
+])
+def test_sell_order_disregarded_utility(eo_s, eo_f, expected):
+    o = create_order(sell_amount=100, buy_amount=200, is_sell_order=True)
+    assert order_disregarded_utility(o, eo_s, eo_f) == (BUY_TOKEN, expected)
+
+
+@pytest.mark.parametrize('eo_s, eo_f, expected', [
+    (Execution(80, 200), Execution(70, 200), 10),
+    (Execution(80, 200), Execution(80, 200), 0),
+    # 100 bought at the submitted rate for 40, 100 at the better rate for 30.
+    (Execution(80, 200), Execution(30, 100), 10),
+    (Execution(80, 200), None, 0),
+    (None, Execution(70, 200), -70),
+])
+def test_buy_order_disregarded_utility(eo_s, eo_f, expected):
+    o = create_order(sell_amount=100, buy_amount=200, is_sell_order=False)
+    assert order_disregarded_utility(o, eo_s, eo_f) == (SELL_TOKEN, expected)
+
+
+def baseline_float_disregarded_utility(o, eo_s, eo_f):
+    """The float computation exact.order_disregarded_utility replaced."""
+    sell_s, buy_s = (eo_s.exec_sell_amount, eo_s.exec_buy_amount) if eo_s is not None else (0, 0)
+    sell_f, buy_f = (eo_f.exec_sell_amount, eo_f.exec_buy_amount) if eo_f is not None else (0, 0)
+    xrate_s = sell_s / buy_s if eo_s is not None else None
+    xrate_f = sell_f / buy_f if eo_f is not None else None
+    if o.is_sell_order:
+        sell_at_xrate_s = max(0, sell_s - sell_f)
+        buy_at_xrate_s = sell_at_xrate_s / xrate_s if sell_at_xrate_s != 0 else 0
+        buy_at_xrate_f = sell_f / xrate_f if sell_f != 0 else 0
+        return buy_at_xrate_s + buy_at_xrate_f - buy_s
+    buy_at_xrate_s = max(0, buy_s - buy_f)
+    sell_at_xrate_s = buy_at_xrate_s * xrate_s if buy_at_xrate_s != 0 else 0
+    sell_at_xrate_f = buy_f * xrate_f if buy_f != 0 else 0
+    return sell_s - (sell_at_xrate_s + sell_at_xrate_f)
+
+
+@pytest.mark.parametrize('is_sell_order', [True, False])
+@pytest.mark.parametrize('eo_s, eo_f', [
+    (Execution(10**18, 1234 * 10**6), Execution(10**18, 1240 * 10**6)),
+    (Execution(10**18, 1234 * 10**6), Execution(6 * 10**17, 745 * 10**6)),
+    (Execution(3 * 10**18, 10**18), Execution(2 * 10**18, 7 * 10**17)),
+    (Execution(12345, 67890), None),
+    (None, Execution(12345, 67890)),
+])
+def test_disregarded_utility_matches_float_baseline(is_sell_order, eo_s, eo_f):
+    o = create_order(sell_amount=10**18, buy_amount=10**9, is_sell_order=is_sell_order)
+    _, du = order_disregarded_utility(o, eo_s, eo_f)
+    assert float(du) == pytest.approx(baseline_float_disregarded_utility(o, eo_s, eo_f), rel=1e-12, abs=1e-6)
+
+
+def test_token_valuation_table():
+    usdc = '0x' + '3' * 40
+    table = create_token_valuation_table({
+        NATIVE_TOKEN: {'decimals': 18, 'external_price': str(10**18)},
+        usdc: {'decimals': 6, 'external_price': str(10**27)},  # 1 USDC = 0.001 ETH
+    })
+    assert table[NATIVE_TOKEN] == (10**18, Fraction(1, 10**18))
+    assert table[usdc] == (10**6, Fraction(1, 10**9))
+
+
+@pytest.mark.parametrize('amount, base, expected', [
+    (1, 4, 25.0),
+    (Fraction(1, 3), 1, 100 / 3),
+    (-5, 200, -2.5),
+    (0, 0, 0.0),
+    (5, 0, math.inf),
+    (-5, 0, -math.inf),
+    (Fraction(1, 10**30), 0, math.inf),
+])
+def test_percentage(amount, base, expected):
+    assert percentage(amount, base) == expected
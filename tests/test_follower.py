@@ -0,0 +1,107 @@
+import asyncio
+
+from aiohttp import web
+
+from validator.follower import CHECKPOINT, Checkpoint, settlements_from_blocks
+from validator.http_client import close_session
+
+
+async def start_node(head, settlements):
+    """Stand-in node answering eth_blockNumber and eth_getLogs batches for `settlements`
+    ({block: txhash}), failing the first request of each kind. Returns the runner, its
+    url and the sizes of the batches it answered."""
+    failures = {'head': 1, 'logs': 1}
+    batch_sizes = []
+
+    def logs(call):
+        (log_filter,) = call['params']
+        from_block, to_block = int(log_filter['fromBlock'], 16), int(log_filter['toBlock'], 16)
+        return [{'transactionHash': txhash} for block, txhash in settlements.items() if from_block <= block <= to_block]
+
+    async def handle(request):
+        body = await request.json()
+        kind = 'head' if isinstance(body, dict) else 'logs'
+        if failures[kind] > 0:
+            failures[kind] -= 1
+            raise web.HTTPServiceUnavailable()
+        if kind == 'head':
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': hex(head)})
+        batch_sizes.append(len(body))
+        return web.json_response([{'jsonrpc': '2.0', 'id': c['id'], 'result': logs(c)} for c in body])
+
+    app = web.Application()
+    app.router.add_post('/', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner, f'http://127.0.0.1:{runner.addresses[0][1]}', batch_sizes
+
+
+async def take(generator, n):
+    items = []
+    async for item in generator:
+        items.append(item)
+        if len(items) == n:
+            break
+    await generator.aclose()
+    return items
+
+
+def test_settlements_from_blocks_retries_and_chunks_catch_up(monkeypatch):
+    monkeypatch.delenv('WEB3_WS_URL', raising=False)
+    monkeypatch.setenv('HTTP_RETRIES', '0')
+    monkeypatch.setenv('WEB3_LOGS_BLOCK_RANGE', '10')
+    monkeypatch.setenv('WEB3_LOGS_BATCH_SIZE', '2')
+
+    async def run():
+        runner, url, batch_sizes = await start_node(150, {125: '0xaa', 150: '0xbb'})
+        monkeypatch.setenv('WEB3_URL', url)
+        try:
+            return await take(settlements_from_blocks(100, 0, 1), 5), batch_sizes
+        finally:
+            await close_session()
+            await runner.cleanup()
+
+    settlements, batch_sizes = asyncio.run(run())
+
+    # The failed head poll and logs batch are retried, and blocks 100-150 are requested in
+    # batches of at most 2 calls of 10 blocks, with a checkpoint after each batch.
+    assert settlements == [(CHECKPOINT, 119), ('0xaa', None), (CHECKPOINT, 139), ('0xbb', None), (CHECKPOINT, 150)]
+    assert batch_sizes == [2, 2, 2]
+
+
+def test_checkpoint_advances_over_completed_prefix(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    checkpoint = Checkpoint(path)
+    assert checkpoint.value is None
+    first, second, block_10 = checkpoint.add(), checkpoint.add(), checkpoint.add(10)
+    third, block_11 = checkpoint.add(), checkpoint.add(11)
+
+    checkpoint.done(block_10)
+    checkpoint.done(second, '0xb')
+    assert checkpoint.value is None
+    checkpoint.done(first, '0xa')
+    assert checkpoint.value == 10
+    checkpoint.done(block_11)
+    assert checkpoint.value == 10
+    checkpoint.done(third, '0xc')
+    assert checkpoint.value == 11
+    assert Checkpoint(path).value == 11
+
+
+def test_checkpoint_keeps_failed_items_until_they_succeed(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    checkpoint = Checkpoint(path)
+    checkpoint.done(checkpoint.add(), '0xa', failed=True)
+    checkpoint.done(checkpoint.add(), '0xb', failed=True)
+    checkpoint.done(checkpoint.add(5))
+
+    # Failed items do not hold the checkpoint back, and are persisted for retries.
+    reloaded = Checkpoint(path)
+    assert (reloaded.value, reloaded.failed) == (5, {'0xa', '0xb'})
+
+    # A successful retry clears the item, a failed one keeps it.
+    reloaded.done(reloaded.add(), '0xa')
+    reloaded.done(reloaded.add(), '0xb', failed=True)
+    reloaded = Checkpoint(path)
+    assert (reloaded.value, reloaded.failed) == (5, {'0xb'})
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from validator import du
+from validator.http_client import close_session
+from validator.replay import FixtureStore, start_replay_servers, stop_replay_servers
+from validator.scheduler import close_solve_scheduler
+from validator.sinks import column_rows, create_sink
+
+# See tests/conftest.py.
+FIXTURE_DIR = Path(__file__).parent / 'fixtures' / 'replay'
+USDC = '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48'
+ORDER_ID = '0x' + '11' * 56
+TXHASH = '0x' + 'ab' * 32
+
+
+async def replay(monkeypatch, auction_id_or_txhash, on_record=None):
+    runners, urls = await start_replay_servers(FixtureStore(FIXTURE_DIR))
+    for env_var, url in urls.items():
+        monkeypatch.setenv(env_var, url)
+    try:
+        return await du.compute_auction_disregarded_utility_info(
+            auction_id_or_txhash, True, None, on_record=on_record
+        )
+    finally:
+        await close_solve_scheduler()
+        await close_session()
+        await stop_replay_servers(runners)
+
+
+def test_replay_recorded_auction(fresh_state, monkeypatch):
+    recorded = json.loads((FIXTURE_DIR / 'auctions.json').read_text())
+    assert [a['auction_id_or_txhash'] for a in recorded] == ['1000']
+
+    du_table, instance, winning_solution = asyncio.run(replay(monkeypatch, '1000'))
+
+    assert instance['metadata']['txhash'] == TXHASH
+    assert instance['metadata']['block_number'] == 15000000
+    assert winning_solution['metadata']['solver'] == 'TestSolver'
+
+    (record,) = list(du_table)
+    assert record['order_id'] == ORDER_ID
+    assert record['token'] == USDC
+    assert record['du'] == 10 * 10**6
+    assert record['surplus'] == 100 * 10**6
+    assert record['du_dec'] == pytest.approx(10.0)
+    assert record['du_ETH'] == pytest.approx(0.01)
+    assert record['du_perc'] == pytest.approx(1.0)
+    assert record['surplus_dec'] == pytest.approx(100.0)
+    assert record['surplus_ETH'] == pytest.approx(0.1)
+    assert record['surplus_perc'] == pytest.approx(10.0)
+    assert not record['estimated']
+
+
+def test_replay_with_router_prefilter(fresh_state, monkeypatch):
+    # The pool pays at most 997 USDC for 1 WETH, less than the submitted 1000 USDC, so the
+    # order is not solved. Its local route misses the submitted price, so the estimate
+    # leaves it unfilled.
+    monkeypatch.setenv('ROUTER_MIN_DU_ETH', '0.001')
+    du_table, _, _ = asyncio.run(replay(monkeypatch, '1000'))
+
+    (record,) = list(du_table)
+    assert record['order_id'] == ORDER_ID
+    assert record['estimated']
+    assert record['du'] == 0
+    assert record['surplus'] == 100 * 10**6
+
+
+def test_streamed_records_match_table(fresh_state, monkeypatch, tmp_path):
+    sink_path = tmp_path / 'records.jsonl'
+    sink = create_sink(sink_path)
+    du_table, instance, winning_solution = asyncio.run(replay(monkeypatch, '1000', du.create_on_record([sink])))
+    sink.close()
+    (record,) = [json.loads(line) for line in sink_path.read_text().splitlines()]
+
+    assert [record] == column_rows(du_table.record_columns('1000', instance, winning_solution))
+    assert record['auction_id_or_txhash'] == '1000'
+    assert record['txhash'] == TXHASH
+    assert record['solver'] == 'TestSolver'
+    assert record['token_alias'] == 'USDC'
+    assert record['du'] == 10 * 10**6
@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+from validator.records import Execution, Order
+from validator.router import ConstantProductRouter, max_disregarded_utility
+
+WETH = '0x' + '1' * 40
+USDC = '0x' + '2' * 40
+DAI = '0x' + '3' * 40
+
+
+def create_amm(token0, token1, balance0, balance1, protocol='Uniswap_2'):
+    return {
+        'protocol': protocol,
+        'state': {'balances': [str(balance0), str(balance1)]},
+        'tokens': [{'address': token0}, {'address': token1}],
+    }
+
+
+def create_order(sell_amount, buy_amount, is_sell_order):
+    return Order(
+        sell_token=WETH, buy_token=USDC, sell_amount=sell_amount, buy_amount=buy_amount,
+        is_sell_order=is_sell_order, is_liquidity_order=False, allow_partial_fill=True,
+        fee_amount=0, fee_token=WETH, cost_amount=0, cost_token=WETH,
+        mandatory=False, has_atomic_execution=False,
+    )
+
+
+def test_max_rate_bounds_best_output():
+    router = ConstantProductRouter({
+        'direct': create_amm(WETH, USDC, 1000 * 10**18, 10**12),
+        'via_dai_0': create_amm(WETH, DAI, 1000 * 10**18, 1005 * 10**21),
+        'via_dai_1': create_amm(DAI, USDC, 10**24, 10**12),
+    })
+    # The spot rate through DAI, 1005 USDC per WETH less two fees, beats the direct pool.
+    assert router.max_rate(WETH, USDC) == pytest.approx(1005 * 10**6 / 10**18 * 0.997**2)
+    for sell_amount in (1, 10**15, 10**18, 10**20):
+        assert router.best_output(WETH, USDC, sell_amount, 3) <= router.max_rate(WETH, USDC) * sell_amount
+    assert router.max_rate(WETH, '0x' + '4' * 40) == 0
+
+
+def test_max_rate_of_gaining_cycle_is_unbounded():
+    router = ConstantProductRouter({
+        'a': create_amm(WETH, USDC, 10**18, 1000 * 10**6),
+        'b': create_amm(USDC, DAI, 10**6, 2 * 10**18),
+        'c': create_amm(DAI, WETH, 10**21, 10**18),
+    })
+    assert router.max_rate(WETH, USDC) == math.inf
+
+
+def test_max_disregarded_utility():
+    router = ConstantProductRouter({'direct': create_amm(WETH, USDC, 1000 * 10**18, 10**12)})
+    # Filled at 1000 USDC per WETH, more than the pool's spot rate.
+    o = create_order(10**18, 900 * 10**6, is_sell_order=True)
+    assert max_disregarded_utility(router, o, Execution(10**18, 1000 * 10**6)) == (USDC, 0)
+    # Half filled at 900 USDC per WETH: filling the other half counts too.
+    o = create_order(2 * 10**18, 1800 * 10**6, is_sell_order=True)
+    token, max_du = max_disregarded_utility(router, o, Execution(10**18, 900 * 10**6))
+    assert token == USDC
+    assert max_du == pytest.approx(2 * 997 * 10**6 - 900 * 10**6, rel=1e-5)
+    assert max_du >= 2 * 997 * 10**6 - 900 * 10**6
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+from validator.common import NATIVE_TOKEN
+from validator.sinks import ParquetSink, dumps
+from validator.valuation import RECORD_FIELDS, TokenValuationColumns, create_disregarded_utility_table
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+TOKEN = NATIVE_TOKEN
+TOKENS = {TOKEN: {'alias': 'WETH', 'decimals': 18, 'external_price': str(10**18)}}
+INSTANCE = {'tokens': TOKENS, 'metadata': {'txhash': '0x' + 'ab' * 32, 'block_number': 15000000}}
+SOLUTION = {'metadata': {'solver': 'TestSolver', 'index': 0}}
+
+
+def record_columns(order_ids, dus):
+    du = create_disregarded_utility_table(
+        TokenValuationColumns(TOKENS), order_ids, [TOKEN] * len(order_ids), dus, dus, dus
+    )
+    return du.record_columns('1000', INSTANCE, SOLUTION)
+
+
+def read_records(path):
+    (file_path,) = path.iterdir()
+    return pq.read_table(file_path).to_pylist()
+
+
+@pytest.mark.parametrize('empty_first', [True, False])
+def test_parquet_sink_skips_empty_auctions(tmp_path, empty_first):
+    sink = ParquetSink(tmp_path, fields=RECORD_FIELDS)
+    tables = [record_columns([], []), record_columns(['a'], [5])]
+    for columns in tables if empty_first else tables[::-1]:
+        sink.write_columns(columns)
+    sink.close()
+
+    (record,) = read_records(tmp_path)
+    assert record['order_id'] == 'a'
+    assert record['block_number'] == 15000000
+    assert not record['estimated']
+
+
+def test_parquet_sink_writes_atoms_as_decimal_strings(tmp_path):
+    sink = ParquetSink(tmp_path, fields=RECORD_FIELDS)
+    sink.write_columns(record_columns(['a'], [10**30]))
+    sink.write({**{name: None for name, _ in RECORD_FIELDS}, 'order_id': 'b', 'du': -2**70})
+    sink.close()
+
+    records = read_records(tmp_path)
+    assert [r['du'] for r in records] == [str(10**30), str(-2**70)]
+    assert records[0]['surplus'] == str(10**30)
+    assert [name for name, _ in RECORD_FIELDS] == list(records[0])
+
+
+def test_dumps_writes_non_finite_floats_as_null():
+    assert dumps({'a': math.inf, 'b': [np.nan, 1.5], 'c': 2**70}) == f'{{"a":null,"b":[null,1.5],"c":{2**70}}}'
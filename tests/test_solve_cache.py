@@ -0,0 +1,92 @@
+import asyncio
+
+from validator import du
+from validator.common import NATIVE_TOKEN
+from validator.records import Order
+from validator.scheduler import close_solve_scheduler
+
+SELL_TOKEN = '0x' + '1' * 40
+BUY_TOKEN = '0x' + '2' * 40
+
+
+def create_order_json(sell_amount, buy_amount, is_liquidity_order):
+    return Order(
+        sell_token=SELL_TOKEN, buy_token=BUY_TOKEN, sell_amount=sell_amount, buy_amount=buy_amount,
+        is_sell_order=True, is_liquidity_order=is_liquidity_order, allow_partial_fill=True,
+        fee_amount=0, fee_token=SELL_TOKEN, cost_amount=0, cost_token=NATIVE_TOKEN,
+        mandatory=False, has_atomic_execution=is_liquidity_order,
+    ).to_json()
+
+
+def create_single_order_instance(order_id, liquidity_order_id, txhash):
+    """The same order problem, under the uids and metadata of one auction."""
+    return {
+        'tokens': {},
+        'amms': {},
+        'orders': {
+            order_id: create_order_json(100, 200, False),
+            liquidity_order_id: create_order_json(300, 600, True),
+        },
+        'metadata': {'gas_price': '1', 'native_token': NATIVE_TOKEN, 'txhash': txhash, 'block_number': 1},
+    }
+
+
+def test_identical_orders_share_one_solve(fresh_state, monkeypatch):
+    solved = []
+
+    async def solve(instance, params):
+        solved.append(instance)
+        await asyncio.sleep(0.01)
+        return {'orders': {
+            o_id: {'exec_sell_amount': o['sell_amount'], 'exec_buy_amount': str(int(o['buy_amount']) + 1)}
+            for o_id, o in instance['orders'].items()
+        }}
+
+    monkeypatch.setattr(du, 'post_single_order_instance', solve)
+
+    async def run():
+        try:
+            # Concurrent solves share the call in flight, later ones hit the cache.
+            first, second = await asyncio.gather(
+                du.solve_single_order(create_single_order_instance('0xa', '0xla', '0x01')),
+                du.solve_single_order(create_single_order_instance('0xb', '0xlb', '0x02')),
+            )
+            third = await du.solve_single_order(create_single_order_instance('0xc', '0xlc', '0x03'))
+            return first, second, third
+        finally:
+            await close_solve_scheduler()
+
+    first, second, third = asyncio.run(run())
+
+    assert len(solved) == 1
+    assert set(solved[0]['orders']) == {'order_0', 'liquidity_0'}
+    assert 'txhash' not in solved[0]['metadata']
+    for solution, (order_id, liquidity_order_id) in zip(
+        (first, second, third), (('0xa', '0xla'), ('0xb', '0xlb'), ('0xc', '0xlc'))
+    ):
+        assert solution['orders'] == {
+            order_id: {'exec_sell_amount': '100', 'exec_buy_amount': '201'},
+            liquidity_order_id: {'exec_sell_amount': '300', 'exec_buy_amount': '601'},
+        }
+
+
+def test_different_orders_are_solved_separately(fresh_state, monkeypatch):
+    solved = []
+
+    async def solve(instance, params):
+        solved.append(instance)
+        return {'orders': {}}
+
+    monkeypatch.setattr(du, 'post_single_order_instance', solve)
+    other = create_single_order_instance('0xb', '0xlb', '0x02')
+    other['orders']['0xb'] = create_order_json(100, 199, False)
+
+    async def run():
+        try:
+            await du.solve_single_order(create_single_order_instance('0xa', '0xla', '0x01'))
+            await du.solve_single_order(other)
+        finally:
+            await close_solve_scheduler()
+
+    asyncio.run(run())
+    assert len(solved) == 2
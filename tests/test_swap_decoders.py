@@ -0,0 +1,111 @@
+from validator.du import update_amm_reserves_from_execution
+from validator.swap_decoders import TOKEN0_CALL, TOKEN1_CALL, event_topic, swap_decoders
+
+POOL = '0x' + 'aa' * 20
+TOKEN0 = '0x' + '01' * 20
+TOKEN1 = '0x' + '02' * 20
+TOKEN2 = '0x' + '03' * 20
+
+
+def encode_word(value):
+    return f'{value % 2**256:064x}'
+
+
+def encode_address(address):
+    return '0x' + '0' * 24 + address[2:]
+
+
+def create_log(event_signature, address, data, topics=()):
+    return {
+        'address': address,
+        'topics': [event_topic(event_signature), *topics],
+        'data': '0x' + ''.join(encode_word(w) for w in data),
+    }
+
+
+def decode(log, call_results=None):
+    return swap_decoders[log['topics'][0]].decode(log, call_results or {})
+
+
+def test_uniswap_v3_swap():
+    # The pool receives 100 of token1 and pays 250 of token0. Log addresses may be checksummed.
+    log = create_log(
+        'Swap(address,address,int256,int256,uint160,uint128,int24)', '0x' + POOL[2:].upper(),
+        [-250, 100, 2**96, 10**18, -5],
+        topics=[encode_address(TOKEN2), encode_address(TOKEN2)],
+    )
+    decoder = swap_decoders[log['topics'][0]]
+    assert decoder.calls(log) == [(POOL, TOKEN0_CALL), (POOL, TOKEN1_CALL)]
+    call_results = {(POOL, TOKEN0_CALL): encode_address(TOKEN0), (POOL, TOKEN1_CALL): encode_address(TOKEN1)}
+
+    address, swap = decode(log, call_results)
+    assert address == POOL
+    assert swap == {
+        'kind': 'uniswap_v3', 'buy_token': TOKEN1, 'sell_token': TOKEN0,
+        'exec_buy_amount': 100, 'exec_sell_amount': 250,
+        'state': {'sqrt_price': str(2**96), 'liquidity': str(10**18), 'tick': -5},
+    }
+
+    amm = {'protocol': 'Uniswap_3', 'state': {'sqrt_price': '1', 'liquidity': '1', 'tick': 0, 'fee': '0.003'}}
+    update_amm_reserves_from_execution(amm, [swap])
+    assert amm['state'] == {'sqrt_price': str(2**96), 'liquidity': str(10**18), 'tick': -5, 'fee': '0.003'}
+
+
+def test_balancer_v2_swap():
+    # Swaps are emitted by the vault, the pool is the prefix of the pool id.
+    pool_id = POOL + '0002' + '00' * 8 + '0001'
+    log = create_log(
+        'Swap(bytes32,address,address,uint256,uint256)', '0x' + 'ba' * 20, [100, 40],
+        topics=[pool_id, encode_address(TOKEN0), encode_address(TOKEN2)],
+    )
+
+    address, swap = decode(log)
+    assert address == POOL
+    assert swap == {
+        'kind': 'balancer_v2', 'buy_token': TOKEN0, 'sell_token': TOKEN2,
+        'exec_buy_amount': 100, 'exec_sell_amount': 40,
+    }
+
+    amm = {
+        'protocol': 'BalancerV2_Weighted',
+        'tokens': [{'address': TOKEN0}, {'address': TOKEN1}, {'address': TOKEN2}],
+        'state': {'balances': ['1000', '2000', '3000']},
+    }
+    update_amm_reserves_from_execution(amm, [swap])
+    assert amm['state']['balances'] == ['1100', '2000', '2960']
+
+
+def test_curve_token_exchange():
+    # The trader sells 100 of coin 2 for 99 of coin 0, so the pool buys coin 2.
+    log = create_log('TokenExchange(address,int128,uint256,int128,uint256)', POOL, [2, 100, 0, 99],
+                     topics=[encode_address(TOKEN1)])
+
+    address, swap = decode(log)
+    assert address == POOL
+    assert swap == {
+        'kind': 'curve', 'buy_token': None, 'sell_token': None,
+        'exec_buy_amount': 100, 'exec_sell_amount': 99,
+        'buy_token_index': 2, 'sell_token_index': 0,
+    }
+
+    amm = {
+        'protocol': 'Curve_',
+        'tokens': [{'address': TOKEN0}, {'address': TOKEN1}, {'address': TOKEN2}],
+        'state': {'balances': ['1000', '2000', '3000']},
+    }
+    update_amm_reserves_from_execution(amm, [swap])
+    assert amm['state']['balances'] == ['901', '2000', '3100']
+
+
+def test_curve_swap_with_unknown_coin_is_skipped():
+    log = create_log('TokenExchange(address,int128,uint256,int128,uint256)', POOL, [3, 100, 0, 99],
+                     topics=[encode_address(TOKEN1)])
+    _, swap = decode(log)
+
+    amm = {
+        'protocol': 'Curve_',
+        'tokens': [{'address': TOKEN0}, {'address': TOKEN1}],
+        'state': {'balances': ['1000', '2000']},
+    }
+    update_amm_reserves_from_execution(amm, [swap])
+    assert amm['state']['balances'] == ['1000', '2000']
@@ -2,26 +2,22 @@ import asyncio
 import json
 import logging
 import os
-from textwrap import indent
-
-import requests
-from async_lru import alru_cache
+from collections import defaultdict
 
 from validator.common import NATIVE_TOKEN, native_token_balance, zero_cost
 
-from .util import freeze_dicts, traced
+from .cache import MISSING, LruCache, cache_key, get_cache
+from .http_client import HttpError, post_json
+from .util import traced
 
 logger = logging.getLogger(__name__)
 
 
-def create_amm_from_lp(lp, token_info, gas_price):
-    """Note: Also updates token_info with new tokens."""
-
-    token_info = dict(token_info)
-
+def add_lp_tokens(tokens, lp):
+    """Adds the tokens of `lp` missing in the token table `tokens`."""
     for t in lp['tokens']:
-        if t['address'] not in token_info.keys():
-            token_info[t['address']] = {
+        if t['address'] not in tokens:
+            tokens[t['address']] = {
                 'alias': t['symbol'],
                 'decimals': t['decimals'],
                 'external_price': None,
@@ -29,6 +25,9 @@ def create_amm_from_lp(lp, token_info, gas_price):
                 'internal_buffer': 0
             }
 
+
+def create_amm_from_lp(lp, tokens, gas_price):
+    """`tokens` is the token table shared by all amms, containing all tokens of `lp`."""
     cost = native_token_balance(int(lp['gas_stats']['median']) * gas_price)
 
     return {
@@ -39,34 +38,131 @@ def create_amm_from_lp(lp, token_info, gas_price):
         'mandatory': False,
         'protocol': lp['protocol'],
         'state': lp['state'],
-        'tokens': [{**token_info[t['address']], 'address': t['address']} for t in lp['tokens']]
+        'tokens': [{**tokens[t['address']], 'address': t['address']} for t in lp['tokens']]
     }
 
 
-@alru_cache(maxsize=None)
 @traced(logging, "Getting liquidity from LPBook.")
-async def get_amms_helper(block_number, token_info, gas_price):
+async def get_lps_trading_tokens(block_number, token_list):
     lpbook_url = os.getenv('LPBOOK_URL')
-    base_tokens = os.getenv('BASE_TOKENS')
-    token_list = list(set(token_info.keys()) | set(base_tokens.split(',')))
-
-    response = await asyncio.to_thread(
-        requests.post,
-        lpbook_url + '/lps_trading_tokens_historic',
-        params={"block_number": block_number},
-        json=token_list
-    )
-
-    if response.status_code != 200:
-        logging.error("Error getting liquidity from LPBook. Served replied with {response.status_code}: {response.text}")
-        raise RuntimeError("Error getting liquidity from LPBook")
-
-    lps = response.json()
-    amms = {lp['address']: create_amm_from_lp(lp, token_info, gas_price) for lp in lps}
-    return amms
+    try:
+        return await post_json(
+            lpbook_url + '/lps_trading_tokens_historic',
+            params={"block_number": block_number},
+            json=token_list
+        )
+    except HttpError as err:
+        logging.error(f"Error getting liquidity from LPBook. Served replied with {err.status}: {err.text}")
+        raise RuntimeError("Error getting liquidity from LPBook") from err
+
+
+class LiquiditySnapshot:
+    """LPBook pools at one block, for the tokens whose pools were fetched so far."""
+
+    def __init__(self):
+        self.lps = {}
+        self.lps_by_token = defaultdict(set)
+        self.tokens = set()
+        self.pending = {}
+
+    def add_lp(self, lp):
+        self.lps[lp['address']] = lp
+        for t in lp['tokens']:
+            self.lps_by_token[t['address'].lower()].add(lp['address'])
+
+
+class LiquidityStore:
+    """LPBook pools indexed by block and token.
+
+    A lookup only requests the tokens whose pools are not known at that block yet, so
+    auctions at the same block share pool states and one extra token costs one small
+    LPBook request. Pools are kept without their cost, which depends on the auction's
+    gas price and is set when amms are created from them. The pools of each (block,
+    token) are also kept in the persistent cache.
+    """
+
+    def __init__(self, max_blocks):
+        self.snapshots = LruCache(max_blocks, name='liquidity_snapshot')
+
+    def snapshot(self, block_number):
+        snapshot = self.snapshots.get(block_number)
+        if snapshot is MISSING:
+            snapshot = LiquiditySnapshot()
+        self.snapshots.set(block_number, snapshot)
+        return snapshot
+
+    @staticmethod
+    def get_cached_lps(cache, lpbook_url, block_number, token):
+        """Returns the pools of `token` at the block from the persistent cache, or None."""
+        addresses = cache.get(cache_key('lpbook_token_lps', [lpbook_url, block_number, token]))
+        if addresses is MISSING:
+            return None
+        lps = [cache.get(cache_key('lpbook_lp', [lpbook_url, block_number, a])) for a in addresses]
+        return lps if MISSING not in lps else None
+
+    async def backfill(self, snapshot, block_number, token_list):
+        cache = get_cache()
+        lpbook_url = os.getenv('LPBOOK_URL')
+        missing = []
+        for t in token_list:
+            lps = self.get_cached_lps(cache, lpbook_url, block_number, t.lower()) if cache is not None else None
+            if lps is None:
+                missing.append(t)
+                continue
+            for lp in lps:
+                snapshot.add_lp(lp)
+            snapshot.tokens.add(t.lower())
+
+        if not missing:
+            return
+        lps = await get_lps_trading_tokens(block_number, missing)
+        for lp in lps:
+            snapshot.add_lp(lp)
+            if cache is not None:
+                cache.set(cache_key('lpbook_lp', [lpbook_url, block_number, lp['address']]), lp)
+        for t in missing:
+            snapshot.tokens.add(t.lower())
+            if cache is not None:
+                cache.set(
+                    cache_key('lpbook_token_lps', [lpbook_url, block_number, t.lower()]),
+                    sorted(snapshot.lps_by_token[t.lower()])
+                )
+
+    async def get(self, block_number, token_list):
+        """Returns all pools trading any of the given tokens at the given block."""
+        snapshot = self.snapshot(block_number)
+        unknown = [t for t in dict.fromkeys(token_list) if t.lower() not in snapshot.tokens and t.lower() not in snapshot.pending]
+        if unknown:
+            backfill = asyncio.ensure_future(self.backfill(snapshot, block_number, unknown))
+            for t in unknown:
+                snapshot.pending[t.lower()] = backfill
+            backfill.add_done_callback(lambda _: [snapshot.pending.pop(t.lower(), None) for t in unknown])
+        await asyncio.gather(*{snapshot.pending[t.lower()] for t in token_list if t.lower() in snapshot.pending})
+        addresses = set().union(*(snapshot.lps_by_token[t.lower()] for t in token_list))
+        return [snapshot.lps[a] for a in sorted(addresses)]
+
+
+_liquidity_store = None
+
+
+def get_liquidity_store():
+    """Returns the process-wide liquidity store, keeping the pools of the last
+    LIQUIDITY_STORE_BLOCKS blocks in memory."""
+    global _liquidity_store
+    if _liquidity_store is None:
+        _liquidity_store = LiquidityStore(int(os.getenv('LIQUIDITY_STORE_BLOCKS', 16)))
+    return _liquidity_store
 
 
 async def get_amms(block_number, token_info, gas_price):
-    return await get_amms_helper(block_number, freeze_dicts(token_info), gas_price)
-
-
+    base_tokens = os.getenv('BASE_TOKENS')
+    # Sorted, so requests for the same tokens are the same and can be replayed.
+    token_list = sorted(set(token_info.keys()) | set(base_tokens.split(',')))
+
+    lps = await get_liquidity_store().get(block_number, token_list)
+    # One token table for all amms, with the tokens only known to LPBook added to a
+    # copy of the instance's tokens.
+    tokens = dict(token_info)
+    for lp in lps:
+        add_lp_tokens(tokens, lp)
+    return {lp['address']: create_amm_from_lp(lp, tokens, gas_price) for lp in lps}
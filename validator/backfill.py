@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import logging
+import logging.config
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .du import DEFAULT_PRUNE_HOPS, compute_instance_disregarded_utility_info
+from .http_client import HttpError, close_session
+from .instance_collect import fetch_instance_and_solutions_of_competition, fetch_solver_competition
+from .scheduler import close_solve_scheduler
+from .sinks import JsonlSink
+from .web3 import get_lp_swaps
+
+logger = logging.getLogger(__name__)
+
+
+def result_path(output_dir, auction_id):
+    return output_dir / f'{auction_id}.jsonl'
+
+
+def pending_auction_ids(output_dir, first_auction_id, last_auction_id):
+    """Auction ids in [first, last] without a result file, i.e. not completed by an
+    earlier run."""
+    return [
+        auction_id for auction_id in range(first_auction_id, last_auction_id + 1)
+        if not result_path(output_dir, auction_id).exists()
+    ]
+
+
+def write_result(output_dir, auction_id, columns):
+    """Writes the records of an auction, and marks it completed by renaming the file
+    into place once it is complete. Auctions without solver competition get an empty
+    result file."""
+    path = result_path(output_dir, auction_id)
+    tmp_path = path.with_suffix('.tmp')
+    sink = JsonlSink(open(tmp_path, 'w+'))
+    if columns is not None:
+        sink.write_columns(columns)
+    sink.close()
+    tmp_path.replace(path)
+
+
+async def backfill_shard(auction_ids, output_dir, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency):
+    """Computes disregarded utility of `auction_ids` in a prefetch -> solve pipeline.
+
+    The prefetch stage fetches instances and the pool swaps of their settlements, so
+    solves never wait on the orderbook, LPBook or the node. Bounded queues keep the
+    prefetch stage at most a few auctions ahead.
+    """
+    stats = {'completed': 0, 'no_competition': 0, 'failed': 0, 'orders': 0, 'du_ETH': 0.0}
+    fetch_queue = asyncio.Queue()
+    solve_queue = asyncio.Queue(maxsize=2 * solve_concurrency)
+    for auction_id in auction_ids:
+        fetch_queue.put_nowait(auction_id)
+
+    async def fetch_worker():
+        while not fetch_queue.empty():
+            auction_id = fetch_queue.get_nowait()
+            # Only a 404 for the competition is final, any other failure leaves the auction
+            # without result file, so the next run retries it.
+            try:
+                solver_competition_info = await fetch_solver_competition(str(auction_id))
+            except HttpError as err:
+                if err.status == 404:
+                    write_result(output_dir, auction_id, None)
+                    stats['no_competition'] += 1
+                else:
+                    logger.error(f'Fetching auction {auction_id} failed: {err!r}')
+                    stats['failed'] += 1
+                continue
+            except Exception as err:
+                logger.error(f'Fetching auction {auction_id} failed: {err!r}')
+                stats['failed'] += 1
+                continue
+            try:
+                instance, solutions = await fetch_instance_and_solutions_of_competition(
+                    solver_competition_info, fetch_amms_from_lpbook=True
+                )
+                await get_lp_swaps(instance['metadata']['txhash'])
+            except Exception as err:
+                logger.error(f'Fetching auction {auction_id} failed: {err!r}')
+                stats['failed'] += 1
+                continue
+            await solve_queue.put((auction_id, instance, solutions))
+
+    async def solve_worker():
+        while True:
+            auction_id, instance, solutions = await solve_queue.get()
+            try:
+                du, instance, winning_solution = await compute_instance_disregarded_utility_info(
+                    str(auction_id), instance, solutions, settled_orders_only, None, prune_hops
+                )
+                write_result(output_dir, auction_id, du.record_columns(str(auction_id), instance, winning_solution))
+                stats['completed'] += 1
+                stats['orders'] += len(du)
+                stats['du_ETH'] += du.total('du_ETH')
+            except Exception as err:
+                logger.error(f'Computing disregarded utility for auction {auction_id} failed: {err!r}')
+                stats['failed'] += 1
+            finally:
+                solve_queue.task_done()
+
+    solve_workers = [asyncio.create_task(solve_worker()) for _ in range(solve_concurrency)]
+    try:
+        await asyncio.gather(*[fetch_worker() for _ in range(fetch_concurrency)])
+        await solve_queue.join()
+    finally:
+        for worker in solve_workers:
+            worker.cancel()
+        await asyncio.gather(*solve_workers, return_exceptions=True)
+        await close_solve_scheduler()
+        await close_session()
+    return stats
+
+
+def run_shard(auction_ids, output_dir, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency, solver_concurrency, solver_max_rate):
+    """Entry point of a worker process."""
+    os.environ['SOLVER_CONCURRENCY'] = str(solver_concurrency)
+    if solver_max_rate is not None:
+        os.environ['SOLVER_MAX_RATE'] = str(solver_max_rate)
+    return asyncio.run(backfill_shard(
+        auction_ids, output_dir, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency
+    ))
+
+
+def split_evenly(total, parts):
+    """`total` split into `parts` integers differing by at most one."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def main(first_auction_id, last_auction_id, output_dir, workers, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency, solver_concurrency, solver_max_rate):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    auction_ids = pending_auction_ids(output_dir, first_auction_id, last_auction_id)
+    nr_skipped = last_auction_id - first_auction_id + 1 - len(auction_ids)
+    logger.info(f'{nr_skipped} auctions already completed, {len(auction_ids)} to go.')
+
+    # Interleaved shards spread busy and quiet periods of the range over all workers,
+    # and the solver capacity is split between them without exceeding it in total, so
+    # there are no more workers than solver calls.
+    workers = max(1, min(workers, len(auction_ids), solver_concurrency))
+    shards = [auction_ids[i::workers] for i in range(workers)]
+    solver_concurrencies = split_evenly(max(solver_concurrency, 1), workers)
+    solver_max_rates = [
+        solver_max_rate * c / sum(solver_concurrencies) if solver_max_rate is not None else None
+        for c in solver_concurrencies
+    ]
+
+    start = time.perf_counter()
+    totals = {'completed': 0, 'no_competition': 0, 'failed': 0, 'orders': 0, 'du_ETH': 0.0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_shard, shard, output_dir, settled_orders_only, prune_hops,
+                fetch_concurrency, solve_concurrency, worker_solver_concurrency, worker_solver_max_rate
+            )
+            for shard, worker_solver_concurrency, worker_solver_max_rate in zip(shards, solver_concurrencies, solver_max_rates)
+            if shard
+        ]
+        for future in as_completed(futures):
+            for name, value in future.result().items():
+                totals[name] += value
+    elapsed = time.perf_counter() - start
+
+    from prettytable import PrettyTable
+
+    tab = PrettyTable(['Skipped', 'Completed', 'No competition', 'Failed', 'Orders', 'DU (ETH)', 'Time (s)', 'Auctions/s'])
+    nr_processed = totals['completed'] + totals['no_competition']
+    tab.add_row([
+        nr_skipped, totals['completed'], totals['no_competition'], totals['failed'], totals['orders'],
+        f'{totals["du_ETH"]:.6f}', f'{elapsed:.1f}', f'{nr_processed / elapsed:.2f}' if elapsed > 0 else '-'
+    ])
+    print(tab)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compute disregarded utility of the winning solutions of a range of auctions, on several worker processes."
+    )
+
+    parser.add_argument(
+        'first_auction_id',
+        type=int,
+        help="First auction id of the range."
+    )
+
+    parser.add_argument(
+        'last_auction_id',
+        type=int,
+        help="Last auction id of the range (inclusive)."
+    )
+
+    parser.add_argument(
+        'output_dir',
+        type=Path,
+        help="Directory to write a <auction id>.jsonl file of records per completed auction to. Auctions with a file are skipped."
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of cores)."
+    )
+
+    parser.add_argument(
+        '--settled_orders_only',
+        action=argparse.BooleanOptionalAction,
+        help="Compute disregarded utility only for orders that were settled in the solution.",
+        default=True
+    )
+
+    parser.add_argument(
+        '--prune_hops',
+        type=int,
+        default=DEFAULT_PRUNE_HOPS,
+        help="Only send the solver amms reachable from an order's tokens within this many hops. Negative values disable pruning."
+    )
+
+    parser.add_argument(
+        '--fetch_concurrency',
+        type=int,
+        default=4,
+        help="Number of auctions prefetched concurrently per worker."
+    )
+
+    parser.add_argument(
+        '--solve_concurrency',
+        type=int,
+        default=4,
+        help="Number of auctions solved concurrently per worker."
+    )
+
+    parser.add_argument(
+        '--solver_concurrency',
+        type=int,
+        default=int(os.getenv('SOLVER_CONCURRENCY', 8)),
+        help="Total number of concurrent solver calls, split between the workers (default: SOLVER_CONCURRENCY)."
+    )
+
+    parser.add_argument(
+        '--solver_max_rate',
+        type=float,
+        default=os.getenv('SOLVER_MAX_RATE') or None,
+        help="Total number of solver calls started per second, split between the workers (default: SOLVER_MAX_RATE, unlimited if unset)."
+    )
+
+    args = parser.parse_args()
+
+    logging.config.fileConfig(fname='logging.conf', disable_existing_loggers=True)
+
+    main(
+        args.first_auction_id, args.last_auction_id, args.output_dir, args.workers, args.settled_orders_only,
+        args.prune_hops, args.fetch_concurrency, args.solve_concurrency, args.solver_concurrency, args.solver_max_rate
+    )
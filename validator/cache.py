@@ -0,0 +1,166 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .profiling import record_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'validator-utils' / 'cache.sqlite'
+
+MISSING = object()
+
+
+def cache_key(namespace, key):
+    """Content address of `key` (any json serializable value) within `namespace`."""
+    canonical = json.dumps(key, sort_keys=True, separators=(',', ':'), default=str)
+    return namespace + ':' + hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class PersistentCache:
+    """Json value store in a SQLite file, evicting least recently used entries
+    once the total size of stored values exceeds max_bytes."""
+
+    def __init__(self, path, max_bytes):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries '
+            '(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            record_cache(key.split(':', 1)[0], row is not None)
+            if row is None:
+                return MISSING
+            self.connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        data = json.dumps(value, separators=(',', ':')).encode()
+        with self.lock:
+            row = self.connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                (key, data, len(data), time.time())
+            )
+            self.size += len(data) - (row[0] if row is not None else 0)
+            if self.size > self.max_bytes:
+                self.evict(int(0.9 * self.max_bytes))
+
+    def evict(self, target_bytes):
+        """Drops least recently used entries until at most target_bytes are stored."""
+        freed, keys = 0, []
+        for key, size in self.connection.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            if self.size - freed <= target_bytes:
+                break
+            keys.append((key,))
+            freed += size
+        self.connection.executemany('DELETE FROM entries WHERE key = ?', keys)
+        self.size -= freed
+        logger.debug(f'Evicted {len(keys)} cache entries ({freed} bytes).')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class LruCache:
+    """In memory cache keeping the max_size most recently used entries. Lookups are
+    counted under `name` when profiling."""
+
+    def __init__(self, max_size, name='lru'):
+        self.max_size = max_size
+        self.name = name
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key, MISSING)
+        record_cache(self.name, value is not MISSING)
+        if value is not MISSING:
+            self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+_cache = MISSING
+
+
+def get_cache():
+    """Returns the process-wide persistent cache, or None if disabled.
+
+    Configured by VALIDATOR_CACHE_PATH (set it to an empty string to disable caching)
+    and VALIDATOR_CACHE_MAX_MB.
+    """
+    global _cache
+    if _cache is MISSING:
+        path = os.getenv('VALIDATOR_CACHE_PATH', str(DEFAULT_CACHE_PATH))
+        max_bytes = int(float(os.getenv('VALIDATOR_CACHE_MAX_MB', 1024)) * 2**20)
+        _cache = PersistentCache(path, max_bytes) if path else None
+    return _cache
+
+
+def persistent_cache(namespace, key=None, is_final=None):
+    """Caches the json serializable results of the decorated function on disk.
+
+    `key` maps the call arguments to the cache key, by default all arguments are used.
+    Only use this on functions whose results never change for the same key, e.g.
+    data at a fixed block number, transaction hash or order uid. If given, only results
+    for which `is_final(result)` holds are stored, e.g. to skip data still in flux.
+    """
+    def persistent_cache_decorator(func):
+        def get_key(args, kwargs):
+            return cache_key(namespace, key(*args, **kwargs) if key is not None else [args, kwargs])
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+            k = get_key(args, kwargs)
+            value = cache.get(k)
+            if value is MISSING:
+                value = func(*args, **kwargs)
+                if is_final is None or is_final(value):
+                    cache.set(k, value)
+            return value
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return await func(*args, **kwargs)
+            k = get_key(args, kwargs)
+            value = cache.get(k)
+            if value is MISSING:
+                value = await func(*args, **kwargs)
+                if is_final is None or is_final(value):
+                    cache.set(k, value)
+            return value
+
+        if asyncio.iscoroutinefunction(func):
+            return async_wrapper
+        else:
+            return sync_wrapper
+
+    return persistent_cache_decorator
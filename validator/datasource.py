@@ -0,0 +1,41 @@
+import logging
+import os
+
+from . import dune, web3
+from .cache import persistent_cache
+
+logger = logging.getLogger(__name__)
+
+# Backends by name, each providing get_block_number_from_txhash,
+# get_gas_price_from_block_number and get_touched_lps.
+DATA_SOURCES = {
+    'rpc': web3,
+    'dune': dune,
+}
+
+
+async def call_with_fallback(function_name, *args):
+    """Calls the function on the backends listed in DATA_SOURCES (default 'rpc,dune'), in
+    order, falling back to the next backend if one fails."""
+    backends = os.getenv('DATA_SOURCES', 'rpc,dune').split(',')
+    for i, backend in enumerate(backends):
+        try:
+            return await getattr(DATA_SOURCES[backend.strip()], function_name)(*args)
+        except Exception as err:
+            if i == len(backends) - 1:
+                raise
+            logger.warning(f'{function_name} through {backend} failed ({err!r}), falling back to {backends[i + 1]}.')
+
+
+@persistent_cache('block_number')
+async def get_block_number_from_txhash(txhash):
+    return await call_with_fallback('get_block_number_from_txhash', txhash)
+
+
+@persistent_cache('median_gas_price')
+async def get_gas_price_from_block_number(block_number):
+    return await call_with_fallback('get_gas_price_from_block_number', block_number)
+
+
+async def get_touched_lps(txhash, lps):
+    return await call_with_fallback('get_touched_lps', txhash, lps)
@@ -1,86 +1,127 @@
 import argparse
 import asyncio
-from inspect import trace
 import json
 import logging
+import logging.config
 import os
-from copy import deepcopy
+import sys
 from math import ceil
 from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
-from prettytable import PrettyTable
 
 from validator.amms import get_amms
 from validator.common import NATIVE_TOKEN, zero_cost
-from validator.util import traced_context
+from validator.util import traced, traced_context
 from validator.web3 import get_lp_swaps
 
-from .dune import get_block_number_from_txhash
+from .cache import MISSING, LruCache, cache_key, get_cache
+from .exact import create_token_valuation_table, mul_div, order_disregarded_utility, order_surplus, percentage, round_fraction
+from .http_client import HttpError, close_session, post_json
 from .instance_collect import fetch_instance_and_solutions
+from .profiling import add_profile_arguments, profiled
+from .prune import TokenGraph, create_pruned_single_order_instance
+from .records import instance_to_json, orders_to_json, parse_solution
+from .scheduler import close_solve_scheduler, get_solve_scheduler
+from .sinks import column_rows, create_sink, dumps
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Max number of amms to trade through from an order's sell/buy token for an amm to be
+# sent to the solver.
+DEFAULT_PRUNE_HOPS = 2
+
 
 def create_updated_order(order_id, instance, solution):
     o = instance['orders'][order_id]
-    updated_o = deepcopy(o) 
 
     # If order is in the solution, then add order with limit price = executed price
     # otherwise add order with original limit price.
-    if order_id in solution['orders']:
-        eo = solution['orders'][order_id]
+    if order_id not in solution['orders']:
+        return o
+
+    eo = solution['orders'][order_id]
+    if o.is_sell_order:
+        limit_amounts = {'buy_amount': mul_div(o.sell_amount, eo.exec_buy_amount, eo.exec_sell_amount)}
+    else:
+        limit_amounts = {'sell_amount': mul_div(o.buy_amount, eo.exec_sell_amount, eo.exec_buy_amount)}
 
+    cost = zero_cost()
+    return o.copy(
+        **limit_amounts,
         # if order is in solution, then filling it a bit more comes for free
-        updated_o['cost'] = zero_cost()
-
-        if o['is_sell_order']:
-            max_sell_amount = int(o['sell_amount'])
-            exec_buy_amount = int(eo['exec_buy_amount'])
-            exec_sell_amount = int(eo['exec_sell_amount'])
-            new_buy_amount = max_sell_amount * exec_buy_amount / exec_sell_amount
-            updated_o['buy_amount'] = str(int(new_buy_amount))
-        else:
-            max_buy_amount = int(o['buy_amount'])
-            exec_buy_amount = int(eo['exec_buy_amount'])
-            exec_sell_amount = int(eo['exec_sell_amount'])
-            new_sell_amount = max_buy_amount * exec_sell_amount / exec_buy_amount
-            updated_o['sell_amount'] = str(int(new_sell_amount))
+        cost_amount=cost['amount'],
+        cost_token=cost['token'],
+        allow_partial_fill=True,
+        is_mandatory=True,
+    )
 
-        updated_o['allow_partial_fill'] = True
-        updated_o['is_mandatory'] = True
 
-    return updated_o      
+def update_balances_from_execution(amm, execution):
+    """Balances transition of pools whose state is a list of token balances. Swaps are
+    matched to tokens by address, or by coin index if the event only carries indices."""
+    token_indices = {t['address']: i for i, t in enumerate(amm['tokens'])}
+    balances = [int(b) for b in amm['state']['balances']]
+    for swap in execution:
+        sell_i = swap.get('sell_token_index', token_indices.get(swap['sell_token']))
+        buy_i = swap.get('buy_token_index', token_indices.get(swap['buy_token']))
+        if any(i is not None and not 0 <= i < len(balances) for i in (sell_i, buy_i)):
+            logger.warning(
+                f"Swap of coins {sell_i} and {buy_i} does not match the {len(balances)} tokens of amm "
+                f"{amm.get('address')}, skipping it."
+            )
+            continue
+        if sell_i is not None:
+            balances[sell_i] -= swap['exec_sell_amount']
+        if buy_i is not None:
+            balances[buy_i] += swap['exec_buy_amount']
+    amm['state']['balances'] = [str(b) for b in balances]
+
+
+def update_concentrated_liquidity_from_execution(amm, execution):
+    """Uniswap v3 swap events carry the pool state after the swap."""
+    amm['state'].update(execution[-1]['state'])
+
+
+# State transitions applying a pool's swaps to its state, by LPBook protocol.
+AMM_STATE_TRANSITIONS = {
+    'Uniswap_2': update_balances_from_execution,
+    'Sushiswap_2': update_balances_from_execution,
+    'Curve_': update_balances_from_execution,
+    'Uniswap_3': update_concentrated_liquidity_from_execution,
+    'BalancerV2_Weighted': update_balances_from_execution,
+    'BalancerV2_Stable': update_balances_from_execution,
+}
 
 
 def update_amm_reserves_from_execution(amm, execution):
-    if amm['protocol'] in ['Uniswap_2', 'Sushiswap_2', 'Curve_']:
-        for token_i in range(len(amm['tokens'])):
-            token = amm['tokens'][token_i]
-            for swap in execution:
-                if swap['sell_token'] == token['address']:
-                    amm['state']['balances'][token_i] = str(
-                        int(amm['state']['balances'][token_i]) - swap['exec_sell_amount']
-                    )
-                elif swap['buy_token'] == token['address']:
-                    amm['state']['balances'][token_i] = str(
-                        int(amm['state']['balances'][token_i]) + swap['exec_buy_amount']
-                    )
-
-
-async def create_updated_instance(instance, solution):
+    transition = AMM_STATE_TRANSITIONS.get(amm['protocol'])
+    if transition is not None:
+        transition(amm, execution)
+
+
+async def create_updated_instance(instance, solution, is_settled=True):
+    """Instance with the orders of `solution` limited to their executed price. If the
+    solution was settled on chain, the amms it used are updated with its swaps; the
+    swaps of solutions that were not settled are unknown, so their amms are left as is."""
     orders = {o_id: create_updated_order(o_id, instance, solution) for o_id in instance['orders'].keys()}
 
-    amms = instance['amms']
+    # amms may be shared with other auctions through the liquidity cache, so touched
+    # amms are copied before being updated.
+    amms = dict(instance['amms'])
     txhash = instance['metadata']['txhash']
-    lpswaps = get_lp_swaps(txhash)
+    lpswaps = await get_lp_swaps(txhash) if is_settled else {}
 
     for amm_id, execution in lpswaps.items():
         if amm_id in amms.keys():
-            amms[amm_id]['cost'] = zero_cost()  # amm was already used so cost is zero
+            amm = amms[amm_id]
+            amms[amm_id] = {
+                **amm,
+                'cost': zero_cost(),  # amm was already used so cost is zero
+                'state': dict(amm['state']),
+            }
             update_amm_reserves_from_execution(amms[amm_id], execution)
 
     tokens = instance['tokens']
@@ -99,146 +140,286 @@ def create_metadata(gas_price_wei):
         "native_token": NATIVE_TOKEN
     }
 
-async def solve_single_order(single_order_instance):
-    quasimodo_url = os.getenv('QUASIMODO_URL')
-    params = {
+def create_solve_params(time_limit=10):
+    return {
         'use_lpbook': False,
         'objective': 'SurplusFeesCosts',
         'ucp_policy': 'Ignore',
         'use_internal_buffers': False, # TODO: also interesting what to do here,
-        'time_limit': 10, 
+        'time_limit': time_limit, 
     }
-    response = await asyncio.to_thread(
-        requests.post,
-        quasimodo_url + '/solve',
-        params=params,
-        json=single_order_instance
-    )
-    if response.status_code != 200:
-        logging.error(f"Error solving single order instance. Solver replied with {response.status_code}: {response.text}")
-        raise RuntimeError("Error solving single order instance")
 
-    return response.json()
 
+@traced(logger, "Solving single order instance with Quasimodo.")
+async def post_single_order_instance(single_order_instance, params):
+    quasimodo_url = os.getenv('QUASIMODO_URL')
+    try:
+        # Retries are left to the solve scheduler, which also backs off on errors.
+        return await post_json(
+            quasimodo_url + '/solve',
+            params={k: str(v) for k, v in params.items()},
+            json=single_order_instance,
+            retries=0,
+            timeout=params['time_limit'] + float(os.getenv('SOLVER_TIMEOUT_MARGIN', 30)),
+        )
+    except HttpError as err:
+        logging.error(f"Error solving single order instance. Solver replied with {err.status}: {err.text}")
+        raise RuntimeError("Error solving single order instance") from err
+
+
+# Solutions of recent single order instances, keyed by a hash of the solver input.
+solve_results = LruCache(int(os.getenv('SOLVE_CACHE_SIZE', 4096)), name='solve')
+solves_in_flight = {}
+
+# Instance metadata the solver reads, the rest (txhash, block number, ...) only
+# identifies the auction.
+SOLVER_METADATA_FIELDS = ('gas_price', 'native_token')
+
+
+def create_canonical_instance(single_order_instance):
+    """Single order instance without anything identifying its auction: metadata the
+    solver does not read is left out and order uids are replaced by placeholders
+    ('order_0', 'liquidity_0', ...), so the same order problem in another auction, or of
+    another order, has the same solver input. Returns it and the {placeholder: uid} map."""
+    order_ids = {}
+    for kind, is_liquidity_order in (('order', False), ('liquidity', True)):
+        uids = sorted(
+            o_id for o_id, o in single_order_instance['orders'].items() if o['is_liquidity_order'] == is_liquidity_order
+        )
+        order_ids.update({f'{kind}_{i}': uid for i, uid in enumerate(uids)})
+    canonical_instance = {
+        **single_order_instance,
+        'orders': {placeholder: single_order_instance['orders'][uid] for placeholder, uid in order_ids.items()},
+        'metadata': {k: v for k, v in single_order_instance['metadata'].items() if k in SOLVER_METADATA_FIELDS},
+    }
+    return canonical_instance, order_ids
+
+
+def restore_order_ids(solution, order_ids):
+    """Solution of a canonical instance with its placeholders mapped back to order uids."""
+    return {**solution, 'orders': {order_ids[o_id]: eo for o_id, eo in solution.get('orders', {}).items()}}
+
+
+async def solve_single_order(single_order_instance, priority=0, time_limit=10):
+    """Solves the instance through the solve scheduler, unless the same canonical
+    instance (see create_canonical_instance) was solved with the same params before or
+    is being solved right now.
+
+    If SOLVE_CACHE_PERSISTENT is set, solutions are also kept in the persistent cache.
+    """
+    params = create_solve_params(time_limit)
+    canonical_instance, order_ids = create_canonical_instance(single_order_instance)
+    key = cache_key('solve', [os.getenv('QUASIMODO_URL'), params, canonical_instance])
+    persistent = get_cache() if os.getenv('SOLVE_CACHE_PERSISTENT') else None
+
+    solution = solve_results.get(key)
+    if solution is MISSING and persistent is not None:
+        solution = persistent.get(key)
+    if solution is not MISSING:
+        solve_results.set(key, solution)
+        return restore_order_ids(solution, order_ids)
+
+    if key in solves_in_flight:
+        return restore_order_ids(await asyncio.shield(solves_in_flight[key]), order_ids)
+
+    scheduler = get_solve_scheduler()
+    solves_in_flight[key] = scheduler.submit(priority, post_single_order_instance, canonical_instance, params)
+    try:
+        solution = await asyncio.shield(solves_in_flight[key])
+    finally:
+        del solves_in_flight[key]
+    solve_results.set(key, solution)
+    if persistent is not None:
+        persistent.set(key, solution)
+    return restore_order_ids(solution, order_ids)
+
+
+async def solve_single_order_adaptive(o_id, single_order_instance, priority, time_limits, original_instance, updated_instance, submitted_solution, token_table):
+    """Solves the order with increasing time limits (`time_limits` seconds), stopping as
+    soon as a solve improves the order's surplus by at most SOLVE_MIN_IMPROVEMENT_ETH over
+    the best solution so far, the submitted one to begin with. Orders without
+    disregarded utility, the common case, only pay for the shortest time limit. Every
+    solve starts from scratch.
+
+    Returns the parsed solution with the most disregarded utility."""
+    min_improvement_eth = float(os.getenv('SOLVE_MIN_IMPROVEMENT_ETH', 0))
+
+    best_solution, best_du_eth = None, 0.0
+    for time_limit in time_limits:
+        solution = parse_solution(await solve_single_order(single_order_instance, priority, time_limit))
+        du_eth = compute_order_disregarded_utility_info(
+            o_id, original_instance, updated_instance, submitted_solution, solution, token_table
+        )['du_ETH']
+        improvement_eth = du_eth - best_du_eth
+        if best_solution is None or improvement_eth > 0:
+            best_solution, best_du_eth = solution, max(best_du_eth, du_eth)
+        if improvement_eth <= min_improvement_eth:
+            break
+    return best_solution
 
-def compute_order_surplus(o_id, original_instance, solution):
-    if o_id not in solution['orders'].keys():
-        exec_buy_amount, exec_sell_amount = 0, 0
-    else:
-        eo = solution['orders'][o_id]
-        exec_buy_amount, exec_sell_amount = int(eo['exec_buy_amount']), int(eo['exec_sell_amount'])
-
-    o = original_instance['orders'][o_id]
-    if o['is_sell_order']:
-        token = o['buy_token']
-        surplus = exec_buy_amount - exec_sell_amount * int(o['buy_amount']) \
-            / int(o['sell_amount'])
-    else:
-        token = o['sell_token']
-        surplus = exec_buy_amount * int(o['sell_amount']) \
-            / int(o['buy_amount']) - exec_sell_amount
 
-    return token, surplus
+def compute_order_surplus(o_id, original_instance, solution):
+    """Exact surplus of the order in the solution, as a Fraction of token atoms."""
+    return order_surplus(original_instance['orders'][o_id], solution['orders'].get(o_id))
 
 
 def compute_order_disregarded_utility(o_id, updated_instance, submitted_solution, solution):
-    def compute_exec_amounts_and_xrate(solution):
-        if o_id not in solution['orders']:
-            exec_buy_amount, exec_sell_amount = 0, 0
-            xrate = None
-        else:
-            eo = solution['orders'][o_id]
-            exec_buy_amount, exec_sell_amount = int(eo['exec_buy_amount']), int(eo['exec_sell_amount'])
-            xrate = exec_sell_amount / exec_buy_amount
-        return exec_sell_amount, exec_buy_amount, xrate
-
-    sell_amount_s, buy_amount_s, xrate_s = compute_exec_amounts_and_xrate(submitted_solution)
-    sell_amount_f, buy_amount_f, xrate_f = compute_exec_amounts_and_xrate(solution)
-
-    updated_o = updated_instance['orders'][o_id]
-    if updated_o['is_sell_order']:
-        #print("-------------------")
-        #print(o_id)
-        #print(sell_amount_s, buy_amount_s, xrate_s)
-        #print(sell_amount_f, buy_amount_f, xrate_f)
-        sell_amount_at_xrate_s = max(0, sell_amount_s - sell_amount_f)
-        buy_amount_at_xrate_s = sell_amount_at_xrate_s / xrate_s if sell_amount_at_xrate_s != 0 else 0
-        buy_amount_at_xrate_f = sell_amount_f / xrate_f if sell_amount_f != 0 else 0
-        du = buy_amount_at_xrate_s + buy_amount_at_xrate_f - buy_amount_s
-        token = updated_o['buy_token']
-    else:
-        buy_amount_at_xrate_s = max(0, buy_amount_s - buy_amount_f)
-        sell_amount_at_xrate_s = buy_amount_at_xrate_s * xrate_s if buy_amount_at_xrate_s != 0 else 0
-        sell_amount_at_xrate_f = buy_amount_f * xrate_f if buy_amount_f != 0 else 0
-        du = sell_amount_s - (sell_amount_at_xrate_s + sell_amount_at_xrate_f)
-        token = updated_o['sell_token']
+    """Exact disregarded utility of the order, as a Fraction of token atoms."""
+    return order_disregarded_utility(
+        updated_instance['orders'][o_id], submitted_solution['orders'].get(o_id), solution['orders'].get(o_id)
+    )
 
-    return token, du
 
+def compute_order_surplus_eth(o_id, original_instance, solution, token_table=None):
+    """Surplus of an order in the solution, in ETH, used to prioritize solves."""
+    if o_id not in solution['orders']:
+        return 0
+    token_table = token_table or create_token_valuation_table(original_instance['tokens'])
+    token, surplus = compute_order_surplus(o_id, original_instance, solution)
+    return float(surplus * token_table[token][1])
 
-def compute_order_disregarded_utility_info(o_id, original_instance, updated_instance, submitted_solution, solution):
+
+def compute_order_exact_disregarded_utility(o_id, original_instance, updated_instance, submitted_solution, solution):
+    """Returns (token, disregarded utility, surplus, executed buy amount) of the order,
+    the first two as exact Fractions of atoms of the token."""
     token, du = compute_order_disregarded_utility(o_id, updated_instance, submitted_solution, solution)
     _, surplus = compute_order_surplus(o_id, original_instance, submitted_solution)
+    eo = submitted_solution['orders'].get(o_id)
+    return token, du, surplus, eo.exec_buy_amount if eo is not None else 0
 
-    token_decimals = updated_instance['tokens'][token]['decimals']
-    native_decimals = updated_instance['tokens'][NATIVE_TOKEN]['decimals']
-    du_dec = du / 10**token_decimals
-    surplus_dec = surplus / 10**token_decimals
-
-    # (amount_ref / amount_tk) = p_tk / p_ref * 10^(d_tk - d_ref)
-    token_external_price = int(updated_instance['tokens'][token]['external_price'])
-    native_external_price = int(updated_instance['tokens'][NATIVE_TOKEN]['external_price'])
-    token_external_price_dec = token_external_price / native_external_price * 10**(token_decimals - native_decimals)
-    du_eth = du_dec * token_external_price_dec
-    surplus_eth = surplus_dec * token_external_price_dec
-
-    if o_id not in submitted_solution['orders']:
-        du_perc = du * float('inf')
-        surplus_perc = 0
-    else:
-        o = submitted_solution['orders'][o_id]
-        du_perc = 100 * du / int(submitted_solution['orders'][o_id]['exec_buy_amount'])
-        surplus_perc = 100 * surplus / int(submitted_solution['orders'][o_id]['exec_buy_amount'])
+
+def compute_order_disregarded_utility_info(o_id, original_instance, updated_instance, submitted_solution, solution, token_table=None):
+    """Disregarded utility and surplus of the order, in token atoms (rounded to the nearest
+    atom), decimals, ETH and percent of the executed buy amount. Everything is computed
+    exactly and rounded only once. Pass the instance's token_table when computing many
+    orders, to build it only once."""
+    token, du, surplus, exec_buy_amount = compute_order_exact_disregarded_utility(
+        o_id, original_instance, updated_instance, submitted_solution, solution
+    )
+
+    token_table = token_table or create_token_valuation_table(updated_instance['tokens'])
+    token_unit, eth_per_atom = token_table[token]
 
     return {
         'token': token,
-        'du': du,
-        'du_dec': du_dec,
-        'du_ETH': du_eth,
-        'du_perc': du_perc,
-        'surplus': surplus,
-        'surplus_dec': surplus_dec,
-        'surplus_ETH': surplus_eth,
-        'surplus_perc': surplus_perc,
+        'du': round_fraction(du),
+        'du_dec': float(du / token_unit),
+        'du_ETH': float(du * eth_per_atom),
+        'du_perc': percentage(du, exec_buy_amount),
+        'surplus': round_fraction(surplus),
+        'surplus_dec': float(surplus / token_unit),
+        'surplus_ETH': float(surplus * eth_per_atom),
+        'surplus_perc': percentage(surplus, exec_buy_amount),
     }
 
 
-async def compute_disregarded_utility_info(original_instance, updated_instance, original_solution, settled_orders_only):
-    du = []
-    liquidity_orders = {o_id: o for o_id, o in updated_instance['orders'].items() if o['is_liquidity_order']}
-    async def compute_du(o_id): 
-        if settled_orders_only and o_id not in original_solution['orders'].keys():
-            return
-        updated_o = updated_instance['orders'][o_id]
-        if not updated_o['is_liquidity_order']:
-            single_order_instance = {
+def compute_solution_disregarded_utility_info(o_ids, original_instance, updated_instance, submitted_solution, solutions, valuation=None, estimated=()):
+    """Batch version of compute_order_disregarded_utility_info for the orders `o_ids` of a
+    submitted solution, given the single order solution of each order in `solutions`.
+    Disregarded utility and surplus are computed exactly per order and valued for all
+    orders at once, returns a DisregardedUtilityTable. Orders in `estimated` were not
+    solved, see compute_disregarded_utility_info."""
+    from .valuation import TokenValuationColumns, create_disregarded_utility_table
+
+    valuation = valuation or TokenValuationColumns(updated_instance['tokens'])
+    exact = [
+        compute_order_exact_disregarded_utility(o_id, original_instance, updated_instance, submitted_solution, solutions[o_id])
+        for o_id in o_ids
+    ]
+    tokens, dus, surpluses, exec_buy_amounts = zip(*exact) if exact else ((), (), (), ())
+    return create_disregarded_utility_table(
+        valuation, o_ids, tokens, dus, surpluses, exec_buy_amounts, [o_id in estimated for o_id in o_ids]
+    )
+
+
+async def compute_disregarded_utility_info(original_instance, updated_instance, original_solution, settled_orders_only, prune_hops=DEFAULT_PRUNE_HOPS, on_result=None):
+    """Returns the disregarded utility info of every order as a DisregardedUtilityTable,
+    and also passes the single row table of each order to `on_result` as soon as it is
+    computed.
+
+    If ROUTER_MIN_DU_ETH is set, orders whose single order instance only holds constant
+    product pools that cannot give them more disregarded utility than that are not sent
+    to the solver. Their best local route is their solution, and their records are
+    marked as estimated."""
+    solutions = {}
+    estimated = set()
+    liquidity_orders = {o_id: o for o_id, o in updated_instance['orders'].items() if o.is_liquidity_order}
+    token_graph = TokenGraph(updated_instance['amms'], updated_instance['tokens'])
+    min_depth_eth = float(os.getenv('PRUNE_MIN_DEPTH_ETH', 0))
+    time_budgets = os.getenv('SOLVE_TIME_BUDGETS')
+    time_limits = [int(t) for t in time_budgets.split(',')] if time_budgets else None
+    token_table = create_token_valuation_table(updated_instance['tokens'])
+    from .valuation import TokenValuationColumns
+    valuation = TokenValuationColumns(updated_instance['tokens'])
+    router_min_du_eth = os.getenv('ROUTER_MIN_DU_ETH')
+    if router_min_du_eth:
+        from .router import ConstantProductRouter, create_local_solution, max_disregarded_utility
+    router_hops = int(os.getenv('ROUTER_MAX_HOPS', 2))
+
+    def create_single_order_instance(o_id, updated_o):
+        if prune_hops is None or prune_hops < 0:
+            return {
                 'tokens' : updated_instance['tokens'],
                 'amms': updated_instance['amms'],
-                'orders': {o_id: updated_o, **liquidity_orders},
+                'orders': orders_to_json({o_id: updated_o, **liquidity_orders}),
                 'metadata': updated_instance['metadata'],            
             }
+        return create_pruned_single_order_instance(
+            updated_instance, token_graph, o_id, liquidity_orders, prune_hops, min_depth_eth
+        )
+
+    def create_estimated_solution(o_id, updated_o, single_order_instance):
+        """Best local route of the order if no solution can give it more disregarded
+        utility than ROUTER_MIN_DU_ETH, None if the order has to be solved. Only an upper
+        bound rules the solver out, which needs every amm of the instance to be a
+        constant product pool the router knows, and no liquidity orders."""
+        if liquidity_orders:
+            return None
+        router = ConstantProductRouter(single_order_instance['amms'])
+        if router.nr_amms != len(single_order_instance['amms']):
+            return None
+        eo = original_solution['orders'].get(o_id)
+        token, max_du = max_disregarded_utility(router, updated_o, eo)
+        if max_du * token_table[token][1] > float(router_min_du_eth):
+            return None
+        return create_local_solution(router, o_id, updated_o, eo, router_hops)
+
+    async def solve(o_id, single_order_instance):
+        priority = compute_order_surplus_eth(o_id, original_instance, original_solution, token_table)
+        if time_limits is not None:
+            return await solve_single_order_adaptive(
+                o_id, single_order_instance, priority, time_limits, original_instance, updated_instance,
+                original_solution, token_table
+            )
+        return parse_solution(await solve_single_order(single_order_instance, priority))
 
-            solution = await solve_single_order(single_order_instance)
-            du_for_order = compute_order_disregarded_utility_info(o_id, original_instance, updated_instance, original_solution, solution)
-            du_for_order['order_id'] = o_id
-            du.append(du_for_order)
+    async def compute_du(o_id): 
+        if settled_orders_only and o_id not in original_solution['orders'].keys():
+            return
+        updated_o = updated_instance['orders'][o_id]
+        if not updated_o.is_liquidity_order:
+            single_order_instance = create_single_order_instance(o_id, updated_o)
+            solution = None
+            if router_min_du_eth:
+                solution = create_estimated_solution(o_id, updated_o, single_order_instance)
+            if solution is None:
+                solution = await solve(o_id, single_order_instance)
+            else:
+                estimated.add(o_id)
+            solutions[o_id] = solution
+            if on_result is not None:
+                on_result(compute_solution_disregarded_utility_info(
+                    [o_id], original_instance, updated_instance, original_solution, solutions, valuation, estimated
+                ))
 
 
     nr_instances = len(updated_instance['orders'].keys())
-    with traced_context(logger, f"Solving {nr_instances} single order instances with Quasimodo ..."):
+    with traced_context(logger, f"Solving {nr_instances} single order instances with Quasimodo ...", stage="Solving single order instances."):
         await asyncio.gather(*[compute_du(o_id) for o_id in updated_instance['orders'].keys()])
 
-    return du
+    return compute_solution_disregarded_utility_info(
+        list(solutions), original_instance, updated_instance, original_solution, solutions, valuation, estimated
+    )
 
 
 def shorten_address(address, length=16):
@@ -248,6 +429,7 @@ def shorten_address(address, length=16):
 
 
 def print_disregarded_utility(solution, solution_dus, instance):
+    from prettytable import PrettyTable
 
     solution_dus = sorted(solution_dus, key=lambda d: (-d['du_ETH'], d['order_id']))
 
@@ -280,20 +462,207 @@ def print_disregarded_utility(solution, solution_dus, instance):
     print(tab)
 
 
-async def compute_auction_disregarded_utility_info(auction_id_or_txhash, settled_orders_only, save_updated_instance):
+def create_on_result(on_record, auction_id_or_txhash, instance, solution):
+    """on_result of compute_disregarded_utility_info passing the record (see
+    DisregardedUtilityTable.record_columns) of each order to `on_record`, None if
+    `on_record` is None."""
+    if on_record is None:
+        return None
+
+    def on_result(order_du):
+        for record in column_rows(order_du.record_columns(auction_id_or_txhash, instance, solution)):
+            on_record(record)
+    return on_result
+
+
+async def compute_auction_disregarded_utility_info(auction_id_or_txhash, settled_orders_only, save_updated_instance, prune_hops=DEFAULT_PRUNE_HOPS, on_record=None):
+    """If given, `on_record` is called with the record (see
+    DisregardedUtilityTable.record_columns) of each order as soon as its disregarded
+    utility is computed."""
     instance, solutions = await fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook=True)
+    return await compute_instance_disregarded_utility_info(
+        auction_id_or_txhash, instance, solutions, settled_orders_only, save_updated_instance, prune_hops, on_record
+    )
+
+
+async def compute_instance_disregarded_utility_info(auction_id_or_txhash, instance, solutions, settled_orders_only, save_updated_instance, prune_hops=DEFAULT_PRUNE_HOPS, on_record=None):
+    """Like compute_auction_disregarded_utility_info, for an already fetched instance."""
     winning_solution = solutions[-1]
     updated_instance = await create_updated_instance(instance, winning_solution)
     if save_updated_instance is not None:
         with open(save_updated_instance, "w+") as f:
-            json.dump(updated_instance, f, indent=2)
-    du = await compute_disregarded_utility_info(instance, updated_instance, winning_solution, settled_orders_only)
+            json.dump(instance_to_json(updated_instance), f, indent=2)
+
+    du = await compute_disregarded_utility_info(
+        instance, updated_instance, winning_solution, settled_orders_only, prune_hops,
+        create_on_result(on_record, auction_id_or_txhash, instance, winning_solution)
+    )
     return du, instance, winning_solution
 
 
-async def main(auction_id_or_txhash, settled_orders_only, save_updated_instance):
-    du, instance, winning_solution = await compute_auction_disregarded_utility_info(auction_id_or_txhash, settled_orders_only, save_updated_instance)
-    print_disregarded_utility(winning_solution, du, instance)
+async def compute_auction_disregarded_utility_info_all_solutions(auction_id_or_txhash, settled_orders_only, prune_hops=DEFAULT_PRUNE_HOPS, on_record=None):
+    """Computes disregarded utility for every competing solution of the auction.
+
+    Returns the instance and a list of (solution, du) pairs, the winning solution last.
+    Every solution limits its orders to its own executed prices, and only the winner's
+    swaps are known, so the winner is valued against the liquidity after the settlement
+    and the others against the liquidity before it. Single order instances are only
+    shared through the solve cache where they are identical, e.g. for an order that
+    neither of two non-winning solutions executed.
+    """
+    instance, solutions = await fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook=True)
+
+    async def compute(solution, is_settled):
+        updated_instance = await create_updated_instance(instance, solution, is_settled)
+        return solution, await compute_disregarded_utility_info(
+            instance, updated_instance, solution, settled_orders_only, prune_hops,
+            create_on_result(on_record, auction_id_or_txhash, instance, solution)
+        )
+
+    solutions_du = await asyncio.gather(*[
+        compute(solution, is_settled=solution is solutions[-1]) for solution in solutions
+    ])
+    return instance, solutions_du
+
+
+def print_solver_comparison(solutions_du, instance):
+    from prettytable import PrettyTable
+
+    def get_row(solution, du):
+        surplus_eth = du.total('surplus_ETH')
+        du_eth = du.total('du_ETH')
+        return [
+            solution['metadata']['index'],
+            solution['metadata']['solver'],
+            len(solution['orders']),
+            f'{surplus_eth:.6f}',
+            f'{du_eth:.6f}',
+            f'{100 * du_eth / surplus_eth:.4f}' if surplus_eth != 0 else '-',
+        ]
+
+    tab = PrettyTable(['Index', 'Solver', 'Orders', 'Surplus (ETH)', 'DU (ETH)', 'DU / Surplus (%)'])
+    tab.add_rows([get_row(solution, du) for solution, du in solutions_du])
+
+    print(f'Solution (txhash) :\t{instance["metadata"]["txhash"]}')
+    print(f'Solution (block)  :\t{instance["metadata"]["block_number"]}')
+    print(tab)
+    print(
+        'Note: the winning solution is valued against the liquidity after its settlement, the others against the '
+        'liquidity before it, so disregarded utility is only roughly comparable between the winner and the others.'
+    )
+
+
+async def compute_batch_disregarded_utility_info(auction_ids_or_txhashes, settled_orders_only, concurrency, prune_hops=DEFAULT_PRUNE_HOPS, on_record=None):
+    """Computes disregarded utility for many auctions, at most `concurrency` at a time.
+
+    Yields (auction_id_or_txhash, du, instance, winning_solution, error) tuples as soon as
+    each auction finishes. Caches and connections are shared between auctions.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def compute(auction_id_or_txhash):
+        async with semaphore:
+            try:
+                du, instance, winning_solution = await compute_auction_disregarded_utility_info(
+                    auction_id_or_txhash, settled_orders_only, None, prune_hops, on_record
+                )
+                return auction_id_or_txhash, du, instance, winning_solution, None
+            except Exception as err:
+                logger.error(f'Computing disregarded utility for {auction_id_or_txhash} failed: {err!r}')
+                return auction_id_or_txhash, None, None, None, err
+
+    for next_result in asyncio.as_completed([compute(a) for a in auction_ids_or_txhashes]):
+        yield await next_result
+
+
+def read_auction_ids_or_txhashes(auction_range, txhash_file):
+    if auction_range is not None:
+        first_auction_id, last_auction_id = auction_range
+        return [str(auction_id) for auction_id in range(first_auction_id, last_auction_id + 1)]
+    with open(txhash_file, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def create_sinks(output_format, sink_paths):
+    from .valuation import RECORD_FIELDS
+
+    sinks = [create_sink(path, RECORD_FIELDS) for path in sink_paths]
+    if output_format == 'jsonl':
+        sinks.append(create_sink('-'))
+    return sinks
+
+
+def create_on_record(sinks):
+    """Writes each record to all sinks, None without sinks."""
+    if not sinks:
+        return None
+
+    def on_record(record):
+        for sink in sinks:
+            sink.write(record)
+    return on_record
+
+
+async def main_batch(auction_ids_or_txhashes, settled_orders_only, concurrency, prune_hops, output_format, sink_paths):
+    sinks = create_sinks(output_format, sink_paths)
+    failed = []
+    try:
+        results = compute_batch_disregarded_utility_info(
+            auction_ids_or_txhashes, settled_orders_only, concurrency, prune_hops, create_on_record(sinks)
+        )
+        async for auction_id_or_txhash, du, instance, winning_solution, error in results:
+            if error is not None:
+                failed.append(auction_id_or_txhash)
+            if output_format != 'table':
+                if error is not None and output_format == 'jsonl':
+                    print(dumps({'auction_id_or_txhash': auction_id_or_txhash, 'error': repr(error)}), flush=True)
+                continue
+            print(f'Auction           :\t{auction_id_or_txhash}')
+            if error is not None:
+                print(f'Error             :\t{error!r}')
+            else:
+                print_disregarded_utility(winning_solution, du, instance)
+            print(flush=True)
+    finally:
+        for sink in sinks:
+            sink.close()
+        await close_solve_scheduler()
+        await close_session()
+    if failed:
+        print(f'{len(failed)} of {len(auction_ids_or_txhashes)} auctions failed: {", ".join(failed)}', file=sys.stderr)
+
+
+async def main_all_solutions(auction_id_or_txhash, settled_orders_only, prune_hops, output_format, sink_paths):
+    sinks = create_sinks(output_format, sink_paths)
+    try:
+        instance, solutions_du = await compute_auction_disregarded_utility_info_all_solutions(
+            auction_id_or_txhash, settled_orders_only, prune_hops, create_on_record(sinks)
+        )
+    finally:
+        for sink in sinks:
+            sink.close()
+        await close_solve_scheduler()
+        await close_session()
+    if output_format == 'table':
+        for solution, du in solutions_du:
+            print_disregarded_utility(solution, du, instance)
+            print()
+        print_solver_comparison(solutions_du, instance)
+
+
+async def main(auction_id_or_txhash, settled_orders_only, save_updated_instance, prune_hops, output_format, sink_paths):
+    sinks = create_sinks(output_format, sink_paths)
+    try:
+        du, instance, winning_solution = await compute_auction_disregarded_utility_info(
+            auction_id_or_txhash, settled_orders_only, save_updated_instance, prune_hops, create_on_record(sinks)
+        )
+    finally:
+        for sink in sinks:
+            sink.close()
+        await close_solve_scheduler()
+        await close_session()
+    if output_format == 'table':
+        print_disregarded_utility(winning_solution, du, instance)
 
 if __name__ == '__main__':
 
@@ -304,9 +673,31 @@ if __name__ == '__main__':
     parser.add_argument(
         'auction_id_or_txhash',
         type=str,
+        nargs='?',
         help="Auction id or transaction hash."
     )
 
+    parser.add_argument(
+        '--auction_range',
+        type=int,
+        nargs=2,
+        metavar=('FIRST', 'LAST'),
+        help="Batch mode: compute disregarded utility for all auction ids in [FIRST, LAST]."
+    )
+
+    parser.add_argument(
+        '--txhash_file',
+        type=Path,
+        help="Batch mode: compute disregarded utility for all transaction hashes in file, one per line."
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help="Batch mode: maximum number of auctions processed concurrently."
+    )
+
     parser.add_argument(
         '--settled_orders_only',
         type=bool,
@@ -314,18 +705,69 @@ if __name__ == '__main__':
         default=True
     )
 
+    parser.add_argument(
+        '--all_solutions',
+        action='store_true',
+        help="Compute disregarded utility of all competing solutions, not only the winning one, and compare solvers."
+    )
+
+    parser.add_argument(
+        '--prune_hops',
+        type=int,
+        default=DEFAULT_PRUNE_HOPS,
+        help="Only send the solver amms reachable from an order's tokens within this many hops. Negative values disable pruning."
+    )
+
+    parser.add_argument(
+        '--output',
+        choices=['table', 'jsonl'],
+        default='table',
+        help="Print a table per auction once all its orders are solved, or a jsonl record per order as soon as it is solved."
+    )
+
+    parser.add_argument(
+        '--sink',
+        type=Path,
+        action='append',
+        default=[],
+        help="Append a record per order to this .jsonl, .csv or .parquet (directory) file as soon as it is solved. Can be repeated."
+    )
+
     parser.add_argument(
         '--save_updated_instance',
         type=Path,
         help="Name of file to dump updated instance to for debugging."
     )
+
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
 
+    is_batch = args.auction_range is not None or args.txhash_file is not None
+    if is_batch == (args.auction_id_or_txhash is not None):
+        parser.error("Either an auction id/transaction hash, --auction_range or --txhash_file is required.")
+    if args.auction_range is not None and args.txhash_file is not None:
+        parser.error("--auction_range and --txhash_file are mutually exclusive.")
+    if is_batch and args.all_solutions:
+        parser.error("--all_solutions is not supported in batch mode.")
+
     auction_id_or_txhash = args.auction_id_or_txhash
     settled_orders_only = args.settled_orders_only
     save_updated_instance = args.save_updated_instance
 
     logging.config.fileConfig(fname='logging.conf', disable_existing_loggers=True)
 
-    asyncio.run(main(auction_id_or_txhash, settled_orders_only, save_updated_instance))
+    with profiled(args):
+        if is_batch:
+            auction_ids_or_txhashes = read_auction_ids_or_txhashes(args.auction_range, args.txhash_file)
+            asyncio.run(main_batch(
+                auction_ids_or_txhashes, settled_orders_only, args.concurrency, args.prune_hops, args.output, args.sink
+            ))
+        elif args.all_solutions:
+            asyncio.run(main_all_solutions(
+                auction_id_or_txhash, settled_orders_only, args.prune_hops, args.output, args.sink
+            ))
+        else:
+            asyncio.run(main(
+                auction_id_or_txhash, settled_orders_only, save_updated_instance, args.prune_hops, args.output, args.sink
+            ))
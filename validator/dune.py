@@ -1,11 +1,29 @@
 import logging
-from duneapi.api import DuneAPI
-from duneapi.types import DuneQuery, Network
 import asyncio
 from .util import traced
 
 logger = logging.getLogger(__name__)
 
+_dune_connection = None
+
+
+def get_dune_connection():
+    """Returns the Dune client shared by all queries of the process. duneapi is only
+    imported once Dune is actually queried."""
+    global _dune_connection
+    if _dune_connection is None:
+        from duneapi.api import DuneAPI
+        _dune_connection = DuneAPI.new_from_environment()
+    return _dune_connection
+
+
+def create_dune_query(raw_sql):
+    from duneapi.types import DuneQuery, Network
+    return DuneQuery.from_environment(
+        raw_sql=raw_sql,
+        network=Network.MAINNET,
+    )
+
 
 def hex_to_dune(hash):
     return '\\' + hash[1:]
@@ -22,12 +40,9 @@ async def get_gas_price_from_block_number(block_number):
         FROM ethereum.transactions
         WHERE block_number = {block_number}
         """
-    query = DuneQuery.from_environment(
-        raw_sql=raw_sql,
-        network=Network.MAINNET,
-    )
+    query = create_dune_query(raw_sql)
 
-    dune_connection = DuneAPI.new_from_environment()
+    dune_connection = get_dune_connection()
     data = await asyncio.to_thread(
         dune_connection.fetch,
         query,
@@ -41,11 +56,8 @@ async def get_block_number_from_txhash(txhash):
     raw_sql = f"""
         select block_number from ethereum.transactions where hash = '{dune_txhash}'
     """
-    query = DuneQuery.from_environment(
-        raw_sql=raw_sql,
-        network=Network.MAINNET,
-    )
-    dune_connection = DuneAPI.new_from_environment()
+    query = create_dune_query(raw_sql)
+    dune_connection = get_dune_connection()
     data = await asyncio.to_thread(
         dune_connection.fetch,
         query,
@@ -61,11 +73,8 @@ async def get_touched_lps(txhash, lps):
         select contract_address from ethereum.logs where tx_hash= '{dune_txhash}' and 
         contract_address in ({lp_ids})
     """
-    query = DuneQuery.from_environment(
-        raw_sql=raw_sql,
-        network=Network.MAINNET,
-    )
-    dune_connection = DuneAPI.new_from_environment()
+    query = create_dune_query(raw_sql)
+    dune_connection = get_dune_connection()
     data = await asyncio.to_thread(
         dune_connection.fetch,
         query,
@@ -0,0 +1,74 @@
+import math
+from fractions import Fraction
+
+from validator.common import NATIVE_TOKEN
+
+ROUND_DOWN = 'down'
+ROUND_UP = 'up'
+ROUND_HALF_EVEN = 'half_even'
+
+
+def mul_div(a, b, c, rounding=ROUND_DOWN):
+    """a * b / c for integers a, b and c > 0, rounded down (floor), up (ceiling) or half to even."""
+    q, r = divmod(a * b, c)
+    if r == 0 or rounding == ROUND_DOWN:
+        return q
+    if rounding == ROUND_UP:
+        return q + 1
+    if rounding == ROUND_HALF_EVEN:
+        return q + 1 if 2 * r > c or (2 * r == c and q % 2 == 1) else q
+    raise ValueError(f"Unknown rounding mode {rounding!r}")
+
+
+def round_fraction(x, rounding=ROUND_HALF_EVEN):
+    return mul_div(x.numerator, 1, x.denominator, rounding)
+
+
+def order_surplus(o, eo):
+    """Surplus of order record `o` with execution `eo` (None if not executed), in atoms of
+    the buy token for sell orders and of the sell token for buy orders."""
+    exec_buy_amount, exec_sell_amount = (eo.exec_buy_amount, eo.exec_sell_amount) if eo is not None else (0, 0)
+    if o.is_sell_order:
+        return o.buy_token, exec_buy_amount - Fraction(exec_sell_amount * o.buy_amount, o.sell_amount)
+    return o.sell_token, Fraction(exec_buy_amount * o.sell_amount, o.buy_amount) - exec_sell_amount
+
+
+def order_disregarded_utility(o, eo_s, eo_f):
+    """Disregarded utility of order record `o` executed as `eo_s` in the submitted solution,
+    given it could have been executed as `eo_f` (either may be None if not executed).
+
+    The part of the submitted execution not covered by `eo_f` is valued at the submitted
+    exchange rate, the rest at the rate of `eo_f`.
+    """
+    sell_s, buy_s = (eo_s.exec_sell_amount, eo_s.exec_buy_amount) if eo_s is not None else (0, 0)
+    sell_f, buy_f = (eo_f.exec_sell_amount, eo_f.exec_buy_amount) if eo_f is not None else (0, 0)
+    if o.is_sell_order:
+        sell_at_xrate_s = max(0, sell_s - sell_f)
+        buy_at_xrate_s = Fraction(sell_at_xrate_s * buy_s, sell_s) if sell_at_xrate_s != 0 else 0
+        buy_at_xrate_f = buy_f if sell_f != 0 else 0
+        return o.buy_token, buy_at_xrate_s + buy_at_xrate_f - buy_s
+    buy_at_xrate_s = max(0, buy_s - buy_f)
+    sell_at_xrate_s = Fraction(buy_at_xrate_s * sell_s, buy_s) if buy_at_xrate_s != 0 else 0
+    sell_at_xrate_f = sell_f if buy_f != 0 else 0
+    return o.sell_token, sell_s - (sell_at_xrate_s + sell_at_xrate_f)
+
+
+def create_token_valuation_table(tokens):
+    """Maps each token to (10**decimals, value of one atom in ETH), computed once per instance.
+
+    (amount_ref / amount_tk) = p_tk / p_ref * 10^(d_tk - d_ref), so one atom of a token
+    is worth p_tk / p_ref / 10^d_ref ETH.
+    """
+    native_token_info = tokens[NATIVE_TOKEN]
+    eth_per_native_atom = Fraction(1, int(native_token_info['external_price']) * 10**native_token_info['decimals'])
+    return {
+        t: (10**info['decimals'], int(info['external_price']) * eth_per_native_atom)
+        for t, info in tokens.items()
+    }
+
+
+def percentage(amount, base):
+    """amount as a percentage of base, +-inf for a non-zero amount of a zero base."""
+    if base == 0:
+        return math.copysign(math.inf, amount) if amount != 0 else 0.0
+    return float(100 * Fraction(amount) / base)
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import json
+import logging
+import logging.config
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from .du import (DEFAULT_PRUNE_HOPS, compute_instance_disregarded_utility_info,
+                 create_on_record, create_sinks, print_disregarded_utility)
+from .http_client import HttpError, close_session, get_json
+from .instance_collect import fetch_instance_and_solutions
+from .scheduler import close_solve_scheduler
+from .swap_decoders import event_topic
+from .web3 import rpc_batch, rpc_call
+
+logger = logging.getLogger(__name__)
+
+SETTLEMENT_CONTRACT = '0x9008d19f58aabd9ed0d60971565aa8510560ab41'
+SETTLEMENT_TOPIC = event_topic('Settlement(address)')
+
+# Yielded by settlement sources in place of an auction id or txhash, to mark that every
+# settlement up to a checkpoint value has been enumerated.
+CHECKPOINT = object()
+
+
+class Checkpoint:
+    """Highest source position (block number or auction id) up to which every settlement
+    has been reported, persisted as json so the follower can resume after a restart.
+
+    Settlements are reported out of order by the pipeline, so the checkpoint only advances
+    over the longest prefix of completed items. Settlements that failed are kept in
+    `failed` and persisted with the checkpoint, so they are retried, also after a restart.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.value = None
+        self.failed = set()
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            self.value = saved['value']
+            self.failed = set(saved.get('failed', []))
+        self.items = OrderedDict()
+        self.next_seq = 0
+
+    def add(self, checkpoint_value=None):
+        """Registers an item in source order, returns its sequence number."""
+        seq = self.next_seq
+        self.next_seq += 1
+        self.items[seq] = [False, checkpoint_value]
+        return seq
+
+    def done(self, seq, auction_id_or_txhash=None, failed=False):
+        """Marks an item completed, successfully or as `failed`."""
+        changed = False
+        if auction_id_or_txhash is not None and failed != (auction_id_or_txhash in self.failed):
+            if failed:
+                self.failed.add(auction_id_or_txhash)
+            else:
+                self.failed.discard(auction_id_or_txhash)
+            changed = True
+
+        self.items[seq][0] = True
+        while self.items:
+            seq, (is_done, checkpoint_value) = next(iter(self.items.items()))
+            if not is_done:
+                break
+            del self.items[seq]
+            if checkpoint_value is not None:
+                self.value = checkpoint_value
+                changed = True
+        if changed:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w+') as f:
+            json.dump({'value': self.value, 'failed': sorted(self.failed)}, f)
+        tmp_path.replace(self.path)
+
+
+async def call_with_backoff(description, function, *args, max_backoff=60):
+    """Calls `function` until it succeeds, waiting with exponential backoff between
+    attempts, so outages of the node or the orderbook only pause the follower."""
+    backoff = 1
+    while True:
+        try:
+            return await function(*args)
+        except Exception as err:
+            logger.warning(f'{description} failed ({err!r}), retrying in {backoff} secs.')
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, max_backoff)
+
+
+async def new_heads_from_websocket(ws_url, max_backoff=60):
+    """Yields the number of every new head, reconnecting with exponential backoff when
+    the connection drops. Heads missed while disconnected are covered by the next one,
+    as consumers process all blocks up to each head."""
+    import websockets
+
+    backoff = 1
+    while True:
+        try:
+            async with websockets.connect(ws_url) as ws:
+                await ws.send(json.dumps({'jsonrpc': '2.0', 'id': 0, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+                await ws.recv()  # subscription id
+                backoff = 1
+                while True:
+                    message = json.loads(await ws.recv())
+                    if 'params' in message:
+                        yield int(message['params']['result']['number'], 16)
+        except (websockets.exceptions.WebSocketException, OSError, asyncio.TimeoutError) as err:
+            logger.warning(f'Websocket connection to {ws_url} lost ({err!r}), reconnecting in {backoff} secs.')
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, max_backoff)
+
+
+async def new_heads_from_polling(poll_interval):
+    head = None
+    while True:
+        block_number = int(await call_with_backoff('Polling the chain head', rpc_call, 'eth_blockNumber', []), 16)
+        if head is None or block_number > head:
+            head = block_number
+            yield head
+        await asyncio.sleep(poll_interval)
+
+
+async def settlements_from_blocks(from_block, confirmations, poll_interval):
+    """Yields (txhash, None) for every settlement from `from_block` on, and (CHECKPOINT, block)
+    once every settlement up to `block` has been yielded.
+
+    Logs are requested in JSON-RPC batches of at most WEB3_LOGS_BATCH_SIZE calls of
+    WEB3_LOGS_BLOCK_RANGE blocks each, so catching up after a long outage does not exceed
+    the batch size limits of providers."""
+    ws_url = os.getenv('WEB3_WS_URL')
+    heads = new_heads_from_websocket(ws_url) if ws_url else new_heads_from_polling(poll_interval)
+    block_range = int(os.getenv('WEB3_LOGS_BLOCK_RANGE', 100))
+    batch_blocks = block_range * int(os.getenv('WEB3_LOGS_BATCH_SIZE', 10))
+    next_block = from_block
+    async for head in heads:
+        to_block = head - confirmations
+        if next_block is None:
+            next_block = to_block
+        while next_block <= to_block:
+            batch_to_block = min(next_block + batch_blocks - 1, to_block)
+            calls = [
+                ('eth_getLogs', [{
+                    'address': SETTLEMENT_CONTRACT,
+                    'fromBlock': hex(start),
+                    'toBlock': hex(min(start + block_range - 1, batch_to_block)),
+                    'topics': [[SETTLEMENT_TOPIC]],
+                }])
+                for start in range(next_block, batch_to_block + 1, block_range)
+            ]
+            results = await call_with_backoff(f'Getting settlements of blocks {next_block}-{batch_to_block}', rpc_batch, calls)
+            logs = [log for logs in results for log in logs]
+            for txhash in dict.fromkeys(log['transactionHash'] for log in logs):
+                yield txhash, None
+            yield CHECKPOINT, batch_to_block
+            next_block = batch_to_block + 1
+
+
+async def settlements_from_orderbook(from_auction_id, poll_interval):
+    """Yields (auction id, auction id) for every auction from `from_auction_id` on, as
+    they appear in the orderbook's latest solver competition."""
+    orderbook_url = os.getenv('ORDERBOOK_URL')
+    next_auction_id = from_auction_id
+    while True:
+        latest = await call_with_backoff(
+            'Polling the latest solver competition', get_json, orderbook_url + '/api/v1/solver_competition/latest'
+        )
+        latest_auction_id = int(latest['auctionId'])
+        if next_auction_id is None:
+            next_auction_id = latest_auction_id
+        for auction_id in range(next_auction_id, latest_auction_id + 1):
+            yield str(auction_id), auction_id
+        next_auction_id = max(next_auction_id, latest_auction_id + 1)
+        await asyncio.sleep(poll_interval)
+
+
+async def fetch_with_retries(auction_id_or_txhash, retries, delay):
+    """Solver competitions of fresh settlements may not be in the orderbook yet, retry
+    a few times on 404. Returns None if the auction has no solver competition."""
+    for attempt in range(retries + 1):
+        try:
+            return await fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook=True)
+        except HttpError as err:
+            if err.status != 404:
+                raise
+            if attempt == retries:
+                logger.debug(f'No solver competition for {auction_id_or_txhash}, skipping.')
+                return None
+            await asyncio.sleep(delay)
+
+
+async def follow(source, checkpoint, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency, on_record, on_auction, poll_interval, confirmations, retry_interval):
+    """Validates settlements as they land, in a fetch -> solve -> report pipeline.
+
+    Bounded queues between the stages make the source wait when validation falls
+    behind, so the lag to the chain head stays bounded by the queue sizes. Settlements
+    that fail are retried every `retry_interval` seconds.
+    """
+    start = checkpoint.value + 1 if checkpoint.value is not None else None
+    if source == 'blocks':
+        settlements = settlements_from_blocks(start, confirmations, poll_interval)
+        # The orderbook may not have stored the competition of a fresh settlement yet.
+        fetch_retries = 5
+    else:
+        settlements = settlements_from_orderbook(start, poll_interval)
+        # Auction ids up to the latest competition without one of their own never get one.
+        fetch_retries = 0
+
+    fetch_queue = asyncio.Queue(maxsize=fetch_concurrency)
+    solve_queue = asyncio.Queue(maxsize=solve_concurrency)
+    retrying = set()
+
+    def done(seq, auction_id_or_txhash, failed=False):
+        retrying.discard(auction_id_or_txhash)
+        checkpoint.done(seq, auction_id_or_txhash, failed)
+
+    async def fetch_worker():
+        while True:
+            seq, auction_id_or_txhash = await fetch_queue.get()
+            try:
+                fetched = await fetch_with_retries(auction_id_or_txhash, fetch_retries, poll_interval)
+            except Exception as err:
+                logger.error(f'Fetching {auction_id_or_txhash} failed: {err!r}')
+                done(seq, auction_id_or_txhash, failed=True)
+                continue
+            if fetched is None:
+                done(seq, auction_id_or_txhash)
+            else:
+                await solve_queue.put((seq, auction_id_or_txhash, fetched))
+
+    async def solve_worker():
+        while True:
+            seq, auction_id_or_txhash, (instance, solutions) = await solve_queue.get()
+            try:
+                du, instance, winning_solution = await compute_instance_disregarded_utility_info(
+                    auction_id_or_txhash, instance, solutions, settled_orders_only, None, prune_hops, on_record
+                )
+                on_auction(auction_id_or_txhash, du, instance, winning_solution)
+            except Exception as err:
+                logger.error(f'Computing disregarded utility for {auction_id_or_txhash} failed: {err!r}')
+                done(seq, auction_id_or_txhash, failed=True)
+                continue
+            done(seq, auction_id_or_txhash)
+
+    async def retry_worker():
+        while True:
+            for auction_id_or_txhash in sorted(checkpoint.failed - retrying):
+                retrying.add(auction_id_or_txhash)
+                await fetch_queue.put((checkpoint.add(), auction_id_or_txhash))
+            await asyncio.sleep(retry_interval)
+
+    workers = [asyncio.create_task(fetch_worker()) for _ in range(fetch_concurrency)]
+    workers += [asyncio.create_task(solve_worker()) for _ in range(solve_concurrency)]
+    workers.append(asyncio.create_task(retry_worker()))
+    try:
+        async for auction_id_or_txhash, checkpoint_value in settlements:
+            if auction_id_or_txhash is CHECKPOINT:
+                checkpoint.done(checkpoint.add(checkpoint_value))
+            else:
+                await fetch_queue.put((checkpoint.add(checkpoint_value), auction_id_or_txhash))
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def main(source, checkpoint_path, start, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency, output_format, sink_paths, poll_interval, confirmations, retry_interval):
+    checkpoint = Checkpoint(checkpoint_path)
+    if checkpoint.value is None and start is not None:
+        checkpoint.value = start - 1
+
+    sinks = create_sinks(output_format, sink_paths)
+
+    def on_auction(auction_id_or_txhash, du, instance, winning_solution):
+        if output_format == 'table':
+            print(f'Auction           :\t{auction_id_or_txhash}')
+            print_disregarded_utility(winning_solution, du, instance)
+            print(flush=True)
+
+    try:
+        await follow(
+            source, checkpoint, settled_orders_only, prune_hops, fetch_concurrency, solve_concurrency,
+            create_on_record(sinks), on_auction, poll_interval, confirmations, retry_interval
+        )
+    finally:
+        for sink in sinks:
+            sink.close()
+        await close_solve_scheduler()
+        await close_session()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compute disregarded utility of settlements as they land on chain."
+    )
+
+    parser.add_argument(
+        '--source',
+        choices=['blocks', 'orderbook'],
+        default='blocks',
+        help="Find settlements in new blocks (through WEB3_WS_URL if set, polling WEB3_URL otherwise) or by polling the orderbook's latest solver competition."
+    )
+
+    parser.add_argument(
+        '--checkpoint',
+        type=Path,
+        default=Path('follower_checkpoint.json'),
+        help="File storing the last block number / auction id up to which all settlements were validated."
+    )
+
+    parser.add_argument(
+        '--start',
+        type=int,
+        help="Block number / auction id to start from if there is no checkpoint yet (default: chain head / latest auction)."
+    )
+
+    parser.add_argument(
+        '--settled_orders_only',
+        action=argparse.BooleanOptionalAction,
+        help="Compute disregarded utility only for orders that were settled in the solution.",
+        default=True
+    )
+
+    parser.add_argument(
+        '--prune_hops',
+        type=int,
+        default=DEFAULT_PRUNE_HOPS,
+        help="Only send the solver amms reachable from an order's tokens within this many hops. Negative values disable pruning."
+    )
+
+    parser.add_argument(
+        '--fetch_concurrency',
+        type=int,
+        default=4,
+        help="Number of settlements fetched concurrently."
+    )
+
+    parser.add_argument(
+        '--solve_concurrency',
+        type=int,
+        default=4,
+        help="Number of settlements solved concurrently."
+    )
+
+    parser.add_argument(
+        '--confirmations',
+        type=int,
+        default=2,
+        help="Blocks source: only look at blocks with this many confirmations."
+    )
+
+    parser.add_argument(
+        '--poll_interval',
+        type=float,
+        default=12,
+        help="Seconds between polls of the chain head or the orderbook."
+    )
+
+    parser.add_argument(
+        '--retry_interval',
+        type=float,
+        default=300,
+        help="Seconds between retries of settlements that failed. Failed settlements are kept in the checkpoint."
+    )
+
+    parser.add_argument(
+        '--output',
+        choices=['table', 'jsonl'],
+        default='table',
+        help="Print a table per settlement, or a jsonl record per order as soon as it is solved."
+    )
+
+    parser.add_argument(
+        '--sink',
+        type=Path,
+        action='append',
+        default=[],
+        help="Append a record per order to this .jsonl, .csv or .parquet (directory) file as soon as it is solved. Can be repeated."
+    )
+
+    args = parser.parse_args()
+
+    logging.config.fileConfig(fname='logging.conf', disable_existing_loggers=True)
+
+    asyncio.run(main(
+        args.source, args.checkpoint, args.start, args.settled_orders_only, args.prune_hops,
+        args.fetch_concurrency, args.solve_concurrency, args.output, args.sink,
+        args.poll_interval, args.confirmations, args.retry_interval
+    ))
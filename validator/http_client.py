@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+import os
+
+import aiohttp
+
+from .profiling import record_bytes
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Called as hook(method, url, params, json body, decoded response) after every
+# successful request, e.g. to record responses.
+response_hooks = []
+
+_session = None
+_session_loop = None
+
+
+class HttpError(RuntimeError):
+    def __init__(self, method, url, status, text):
+        super().__init__(f"{method} {url} failed with {status}: {text}")
+        self.status = status
+        self.text = text
+
+
+def is_retryable(error):
+    """Whether a request that failed with `error`, or with an error `error` was raised
+    from, may succeed when retried: rate limiting, server errors and timeouts."""
+    while error is not None:
+        if isinstance(error, HttpError):
+            return error.status in RETRY_STATUSES
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+def get_session():
+    """Returns the shared, pooled HTTP session of the running event loop."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=int(os.getenv('HTTP_POOL_SIZE', 100)))
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session, _session_loop = None, None
+
+
+async def request_json(method, url, retries=None, timeout=None, backoff=None, **kwargs):
+    """Sends a request through the shared session and returns the decoded json body.
+
+    Connection errors, timeouts and RETRY_STATUSES are retried with exponential
+    backoff, any other non-200 reply raises HttpError right away.
+    """
+    retries = int(os.getenv('HTTP_RETRIES', 3)) if retries is None else retries
+    timeout = float(os.getenv('HTTP_TIMEOUT', 30)) if timeout is None else timeout
+    backoff = float(os.getenv('HTTP_BACKOFF', 0.5)) if backoff is None else backoff
+
+    for attempt in range(retries + 1):
+        try:
+            async with get_session().request(
+                method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+            ) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    record_bytes(url, len(body))
+                    data = json.loads(body)
+                    for hook in response_hooks:
+                        hook(method, url, kwargs.get('params'), kwargs.get('json'), data)
+                    return data
+                error = HttpError(method, url, response.status, await response.text())
+                if response.status not in RETRY_STATUSES:
+                    raise error
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            error = err
+        if attempt < retries:
+            delay = backoff * 2**attempt
+            logger.debug(f'{method} {url} failed ({error!r}), retrying in {delay:.2f} secs.')
+            await asyncio.sleep(delay)
+    raise error
+
+
+async def get_json(url, **kwargs):
+    return await request_json('GET', url, **kwargs)
+
+
+async def post_json(url, **kwargs):
+    return await request_json('POST', url, **kwargs)
@@ -3,18 +3,21 @@ import asyncio
 import json
 import logging
 import os
-from copy import deepcopy
 from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
-from duneapi.api import DuneAPI
-from duneapi.types import DuneQuery, Network
 from validator.amms import get_amms
 
 from validator.common import NATIVE_TOKEN, ORDER_COST
-from validator.web3 import get_block_number_from_txhash
 
+from .cache import MISSING, cache_key, get_cache, persistent_cache
+from .datasource import get_block_number_from_txhash
+from .exact import mul_div
+from .http_client import HttpError, close_session, get_json, post_json
+from .profiling import add_profile_arguments, profiled
+from .records import Execution, Order, instance_to_json, solution_to_json
+from .sinks import dump
+from .tokens import get_token_store
 from .util import traced
 
 logger = logging.getLogger(__name__)
@@ -22,25 +25,15 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 
-async def get_token_info_from_dune(token_addresses, external_prices):
-    token_sql = ",".join(f"'\\{t[1:]}'" for t in token_addresses)
-    raw_sql = f"select * from erc20.tokens where contract_address in ({token_sql})"
-    query = DuneQuery.from_environment(
-        raw_sql=raw_sql,
-        network=Network.MAINNET,
-    )
-    dune_connection = DuneAPI.new_from_environment()
-    data = await asyncio.to_thread(
-        dune_connection.fetch,
-        query,
-    )
+async def get_token_info(token_addresses, external_prices):
+    token_metadata = await get_token_store().get(token_addresses)
     return {
-        '0' + t['contract_address'][1:]: {
-            'alias': t['symbol'],
-            'decimals': t['decimals'],
-            'normalize_priority': 0 if t['contract_address'][1:] != NATIVE_TOKEN[1:] else 1,
-            'external_price': external_prices['0' + t['contract_address'][1:]],
-        } for t in data
+        t: {
+            'alias': m['symbol'],
+            'decimals': m['decimals'],
+            'normalize_priority': 0 if t != NATIVE_TOKEN else 1,
+            'external_price': external_prices[t],
+        } for t, m in token_metadata.items()
     }
 
 async def create_token_info(orders_info, external_prices):
@@ -50,25 +43,25 @@ async def create_token_info(orders_info, external_prices):
         token_addresses.append(NATIVE_TOKEN)
         external_prices[NATIVE_TOKEN] = '1000000000000000000'
 
-    return await get_token_info_from_dune(token_addresses, external_prices)
+    return await get_token_info(token_addresses, external_prices)
 
 def create_order_info(order):
-    return order['uid'], {
-        'buy_token': order['buyToken'],
-        'sell_token': order['sellToken'],
-        'buy_amount': order['buyAmount'],
-        'sell_amount': order['sellAmount'],
-        'is_sell_order': order['kind'] == 'sell',
-        'is_liquidity_order': order['isLiquidityOrder'],
-        'allow_partial_fill': order['partiallyFillable'],
-        'fee': {
-            'amount': order['feeAmount'],
-            'token': order['sellToken']
-        },
-        'cost': ORDER_COST, # FIXME: we don't have this info yet, assuming cow protocol orders for now
-        'mandatory': False,
-        'has_atomic_execution': order['isLiquidityOrder']   # FIXME: we don't have this info yet, playing safe for now
-    }
+    return order['uid'], Order(
+        buy_token=order['buyToken'],
+        sell_token=order['sellToken'],
+        buy_amount=int(order['buyAmount']),
+        sell_amount=int(order['sellAmount']),
+        is_sell_order=order['kind'] == 'sell',
+        is_liquidity_order=order['isLiquidityOrder'],
+        allow_partial_fill=order['partiallyFillable'],
+        fee_amount=int(order['feeAmount']),
+        fee_token=order['sellToken'],
+        # FIXME: we don't have this info yet, assuming cow protocol orders for now
+        cost_amount=int(ORDER_COST['amount']),
+        cost_token=ORDER_COST['token'],
+        mandatory=False,
+        has_atomic_execution=order['isLiquidityOrder']   # FIXME: we don't have this info yet, playing safe for now
+    )
 
 def create_orders(orders_info):
     orders = {}
@@ -106,33 +99,90 @@ def create_solution(instance, solution_info, solution_index):
     for eo in solution_info['orders']:
         o_id = eo['id']
         o = instance['orders'][o_id]
-        p_b = int(solution_info['clearingPrices'][o['buy_token']])
-        p_s = int(solution_info['clearingPrices'][o['sell_token']])
-        if o['is_sell_order']:
+        p_b = int(solution_info['clearingPrices'][o.buy_token])
+        p_s = int(solution_info['clearingPrices'][o.sell_token])
+        if o.is_sell_order:
             exec_sell_amount = int(eo['executedAmount'])
-            exec_buy_amount = exec_sell_amount * p_s / p_b
+            exec_buy_amount = mul_div(exec_sell_amount, p_s, p_b)
         else:
             exec_buy_amount = int(eo['executedAmount'])
-            exec_sell_amount = exec_buy_amount * p_b / p_s
-        solution['orders'][o_id] = deepcopy(instance['orders'][o_id])    
-        solution['orders'][o_id]['exec_sell_amount'] = str(int(exec_sell_amount))
-        solution['orders'][o_id]['exec_buy_amount'] = str(int(exec_buy_amount))
+            exec_sell_amount = mul_div(exec_buy_amount, p_b, p_s)
+        # The execution refers to the instance's order record, no copy needed.
+        solution['orders'][o_id] = Execution(exec_sell_amount, exec_buy_amount, order=o)
     return solution
 
+# Set to False once the orderbook is known not to serve the bulk lookup endpoint.
+orderbook_has_bulk_lookup = True
+
+
+async def fetch_orders_bulk(order_ids):
+    """Fetches orders through the orderbook bulk lookup endpoint, in chunks.
+
+    Returns None if the orderbook does not serve the endpoint.
+    """
+    global orderbook_has_bulk_lookup
+    orderbook_url = os.getenv('ORDERBOOK_URL')
+    chunk_size = int(os.getenv('ORDERBOOK_BULK_SIZE', 128))
+    chunks = [order_ids[i:i + chunk_size] for i in range(0, len(order_ids), chunk_size)]
+    try:
+        responses = await asyncio.gather(*[
+            post_json(orderbook_url + '/api/v1/orders/lookup', json=chunk) for chunk in chunks
+        ])
+    except HttpError as err:
+        if err.status not in (404, 405):
+            raise
+        logger.debug('Orderbook has no bulk order lookup, falling back to single order requests.')
+        orderbook_has_bulk_lookup = False
+        return None
+    return {o['uid']: o for response in responses for o in response}
+
+
+@traced(logger, "Fetching orders from orderbook.")
+async def fetch_orders(order_ids):
+    orderbook_url = os.getenv('ORDERBOOK_URL')
+    order_ids = list(order_ids)
+
+    orders_by_id = {}
+    if orderbook_has_bulk_lookup and len(order_ids) > 1:
+        orders_by_id = await fetch_orders_bulk(order_ids) or {}
+
+    semaphore = asyncio.Semaphore(int(os.getenv('ORDERBOOK_CONCURRENCY', 16)))
+    async def fetch_order(oid):
+        async with semaphore:
+            return await get_json(orderbook_url + f'/api/v1/orders/{oid}')
+
+    missing_ids = [oid for oid in order_ids if oid not in orders_by_id]
+    for oid, order_info in zip(missing_ids, await asyncio.gather(*[fetch_order(oid) for oid in missing_ids])):
+        orders_by_id[oid] = order_info
+
+    return [orders_by_id[oid] for oid in order_ids]
+
+
+async def fetch_orders_cached(order_ids):
+    """Like fetch_orders, but only requests orders not in the persistent cache."""
+    cache = get_cache()
+    if cache is None:
+        return await fetch_orders(order_ids)
+
+    keys = {oid: cache_key('order', oid) for oid in order_ids}
+    orders_by_id = {oid: cache.get(k) for oid, k in keys.items()}
+    missing_ids = [oid for oid, o in orders_by_id.items() if o is MISSING]
+    if missing_ids:
+        for oid, order_info in zip(missing_ids, await fetch_orders(missing_ids)):
+            cache.set(keys[oid], order_info)
+            orders_by_id[oid] = order_info
+    return [orders_by_id[oid] for oid in order_ids]
+
+
 async def fetch_instance(solver_competition_info, fetch_amms_from_lpbook):
     txhash = solver_competition_info['transactionHash']
-    orderbook_url = os.getenv('ORDERBOOK_URL')
-    
-    orders_info = []
-    for oid in solver_competition_info['auction']['orders']:
-        url = orderbook_url + f'/api/v1/orders/{oid}'
-        order_info = requests.get(url).json()
-        orders_info.append(order_info)
+
+    orders_info = await fetch_orders_cached(solver_competition_info['auction']['orders'])
 
     instance = await create_instance(orders_info, solver_competition_info)
 
     if fetch_amms_from_lpbook:
-        block_number = get_block_number_from_txhash(txhash)
+        block_number = await get_block_number_from_txhash(txhash)
         amms = await get_amms(block_number, instance['tokens'], int(instance['metadata']['gas_price']))
         instance['amms'] = amms
         instance['metadata']['block_number'] = block_number
@@ -143,15 +193,23 @@ async def fetch_instance(solver_competition_info, fetch_amms_from_lpbook):
 def is_txhash(auction_id_or_txhash):
     return isinstance(auction_id_or_txhash, str) and len(auction_id_or_txhash)>2 and auction_id_or_txhash[:2]=='0x'
 
-@traced(logger, "Fetching instance and solutions.")
-async def fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook):
+# Competitions fetched before their settlement landed have no transactionHash yet, and
+# are fetched again next time.
+@persistent_cache(
+    'solver_competition',
+    key=lambda auction_id_or_txhash: [os.getenv('ORDERBOOK_URL'), auction_id_or_txhash],
+    is_final=lambda competition: competition.get('transactionHash') is not None,
+)
+@traced(logger, "Fetching solver competition from orderbook.")
+async def fetch_solver_competition(auction_id_or_txhash):
     orderbook_url = os.getenv('ORDERBOOK_URL')
     if is_txhash(auction_id_or_txhash):
         solver_competition_url = orderbook_url + f'/api/v1/solver_competition/by_tx_hash/{auction_id_or_txhash}'    
     else:
         solver_competition_url = orderbook_url + f'/api/v1/solver_competition/{auction_id_or_txhash}'
-    solver_competition_info = requests.get(solver_competition_url).json()
+    return await get_json(solver_competition_url)
 
+async def fetch_instance_and_solutions_of_competition(solver_competition_info, fetch_amms_from_lpbook):
     instance = await fetch_instance(solver_competition_info, fetch_amms_from_lpbook)
 
     solutions = []
@@ -160,17 +218,32 @@ async def fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpb
     
     return instance, solutions
 
-async def main(auction_id_or_txhash, output_dir, fetch_amms_from_lpbook):
-    instance, solutions = await fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook)
-    with open(output_dir / f'instance_{auction_id_or_txhash}.json', 'w+') as f:
-        json.dump(instance, f, indent=2)
+@traced(logger, "Fetching instance and solutions.")
+async def fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook):
+    solver_competition_info = await fetch_solver_competition(auction_id_or_txhash)
+    return await fetch_instance_and_solutions_of_competition(solver_competition_info, fetch_amms_from_lpbook)
+
+def write_json(obj, path, compact):
+    with open(path, 'w+') as f:
+        if compact:
+            dump(obj, f)
+        else:
+            json.dump(obj, f, indent=2)
+
+
+async def main(auction_id_or_txhash, output_dir, fetch_amms_from_lpbook, compact):
+    try:
+        instance, solutions = await fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook)
+    finally:
+        await close_session()
+    write_json(instance_to_json(instance), output_dir / f'instance_{auction_id_or_txhash}.json', compact)
     for solution in solutions:
-        with open(
+        write_json(
+            solution_to_json(solution),
             output_dir / 
             f'solution_{auction_id_or_txhash}_{solution["metadata"]["index"]}_{solution["metadata"]["solver"]}.json',
-            'w+'
-        ) as f:
-            json.dump(solution, f, indent=2)
+            compact
+        )
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -196,10 +269,19 @@ if __name__ == '__main__':
         help="Fetch amm's from lpbook."
     )
 
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help="Write compact json without indentation (through orjson if installed)."
+    )
+
+    add_profile_arguments(parser)
+
     args = parser.parse_args()
 
     auction_id_or_txhash = args.auction_id_or_txhash
     output_dir = args.output_dir
     fetch_amms_from_lpbook = args.use_lpbook
-    asyncio.run(main(auction_id_or_txhash, output_dir, fetch_amms_from_lpbook))
+    with profiled(args):
+        asyncio.run(main(auction_id_or_txhash, output_dir, fetch_amms_from_lpbook, args.compact))
 
@@ -0,0 +1,223 @@
+import contextvars
+import itertools
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+# Base url environment variables of the external services, by stage name.
+SERVICE_URLS = {
+    'orderbook': 'ORDERBOOK_URL',
+    'lpbook': 'LPBOOK_URL',
+    'quasimodo': 'QUASIMODO_URL',
+    'rpc': 'WEB3_URL',
+}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('id', 'parent_id', 'name', 'start', 'end', 'failed')
+
+    def __init__(self, id, parent_id, name, start):
+        self.id = id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start
+        self.end = None
+        self.failed = False
+
+
+class Profiler:
+    """Records nested timing spans, bytes transferred per service and cache hits/misses.
+
+    Spans nest along the async call chain: a span opened while another one is open in
+    the same task (or the task that created it) is its child.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.ids = itertools.count()
+        self.bytes = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        parent = _current_span.get()
+        span = Span(next(self.ids), parent.id if parent is not None else None, name, time.perf_counter())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.failed = True
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+            self.spans.append(span)
+
+    def record_bytes(self, url, nr_bytes):
+        self.bytes[service_name(url)] += nr_bytes
+
+    def record_cache(self, namespace, hit):
+        if hit:
+            self.cache_hits[namespace] += 1
+        else:
+            self.cache_misses[namespace] += 1
+
+    def stage_durations(self):
+        durations = defaultdict(list)
+        for span in self.spans:
+            durations[span.name].append(span.end - span.start)
+        return durations
+
+    def print_report(self, file=None):
+        """Prints the tables to stderr by default, to keep them apart from jsonl output."""
+        from prettytable import PrettyTable
+
+        file = file if file is not None else sys.stderr
+        tab = PrettyTable(['Stage', 'Calls', 'Total (s)', 'p50 (s)', 'p95 (s)', 'p99 (s)', 'Max (s)'])
+        stages = sorted(self.stage_durations().items(), key=lambda item: -sum(item[1]))
+        for name, durations in stages:
+            durations = sorted(durations)
+            tab.add_row([
+                name, len(durations), f'{sum(durations):.4f}',
+                *(f'{percentile(durations, p):.4f}' for p in (50, 95, 99)), f'{durations[-1]:.4f}',
+            ])
+        print(f'Wall time         :\t{time.perf_counter() - self.start:.4f} secs', file=file)
+        print(tab, file=file)
+
+        if self.bytes:
+            tab = PrettyTable(['Service', 'Bytes received'])
+            tab.add_rows(sorted(self.bytes.items()))
+            print(tab, file=file)
+
+        namespaces = sorted(set(self.cache_hits) | set(self.cache_misses))
+        if namespaces:
+            tab = PrettyTable(['Cache', 'Hits', 'Misses', 'Hit rate (%)'])
+            for namespace in namespaces:
+                hits, misses = self.cache_hits[namespace], self.cache_misses[namespace]
+                tab.add_row([namespace, hits, misses, f'{100 * hits / (hits + misses):.1f}'])
+            print(tab, file=file)
+
+    def write_prometheus(self, path):
+        """Writes stage durations as summaries, bytes and cache lookups as counters, in the
+        Prometheus text exposition format."""
+        lines = ['# TYPE validator_stage_duration_seconds summary']
+        for name, durations in sorted(self.stage_durations().items()):
+            durations = sorted(durations)
+            label = json.dumps(name)
+            for p in (50, 95, 99):
+                lines.append(f'validator_stage_duration_seconds{{stage={label},quantile="{p / 100}"}} {percentile(durations, p)}')
+            lines.append(f'validator_stage_duration_seconds_sum{{stage={label}}} {sum(durations)}')
+            lines.append(f'validator_stage_duration_seconds_count{{stage={label}}} {len(durations)}')
+        lines.append('# TYPE validator_received_bytes_total counter')
+        for service, nr_bytes in sorted(self.bytes.items()):
+            lines.append(f'validator_received_bytes_total{{service="{service}"}} {nr_bytes}')
+        lines.append('# TYPE validator_cache_lookups_total counter')
+        for namespace in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            lines.append(f'validator_cache_lookups_total{{cache="{namespace}",result="hit"}} {self.cache_hits[namespace]}')
+            lines.append(f'validator_cache_lookups_total{{cache="{namespace}",result="miss"}} {self.cache_misses[namespace]}')
+        with open(path, 'w+') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def write_chrome_trace(self, path):
+        """Writes spans in the Chrome trace event format (chrome://tracing, Perfetto).
+        Concurrent sibling spans are put on separate rows."""
+        rows_end = []
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            row = next((i for i, end in enumerate(rows_end) if end <= span.start), len(rows_end))
+            if row == len(rows_end):
+                rows_end.append(span.end)
+            else:
+                rows_end[row] = span.end
+            events.append({
+                'name': span.name,
+                'ph': 'X',
+                'ts': (span.start - self.start) * 1e6,
+                'dur': (span.end - span.start) * 1e6,
+                'pid': os.getpid(),
+                'tid': row,
+                'args': {'id': span.id, 'parent_id': span.parent_id, 'failed': span.failed},
+            })
+        with open(path, 'w+') as f:
+            json.dump({'traceEvents': events}, f)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of a non-empty sorted list."""
+    rank = max(0, min(len(sorted_values) - 1, -(-p * len(sorted_values) // 100) - 1))
+    return sorted_values[rank]
+
+
+def service_name(url):
+    for name, env_var in SERVICE_URLS.items():
+        base_url = os.getenv(env_var)
+        if base_url and url.startswith(base_url):
+            return name
+    return urlparse(url).netloc
+
+
+profiler = None
+
+
+def enable_profiling():
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+
+def record_bytes(url, nr_bytes):
+    if profiler is not None:
+        profiler.record_bytes(url, nr_bytes)
+
+
+def record_cache(namespace, hit):
+    if profiler is not None:
+        profiler.record_cache(namespace, hit)
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Print a per stage timing breakdown, bytes received per service and cache hit rates at exit."
+    )
+
+    parser.add_argument(
+        '--profile_prometheus',
+        type=Path,
+        help="Write the profile to this file in the Prometheus text format."
+    )
+
+    parser.add_argument(
+        '--profile_trace',
+        type=Path,
+        help="Write the recorded spans to this file in the Chrome trace json format."
+    )
+
+
+@contextmanager
+def profiled(args):
+    """Profiles the block if any of the add_profile_arguments options is set, and reports
+    the profile afterwards."""
+    if not (args.profile or args.profile_prometheus or args.profile_trace):
+        yield
+        return
+    enable_profiling()
+    try:
+        yield
+    finally:
+        if args.profile:
+            profiler.print_report()
+        if args.profile_prometheus is not None:
+            profiler.write_prometheus(args.profile_prometheus)
+        if args.profile_trace is not None:
+            profiler.write_chrome_trace(args.profile_trace)
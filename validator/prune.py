@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from validator.common import NATIVE_TOKEN
+
+from .exact import create_token_valuation_table
+from .records import orders_to_json
+
+
+def create_token_amm_index(amms):
+    """Maps each token to the ids of the amms trading it."""
+    index = defaultdict(list)
+    for amm_id, amm in amms.items():
+        for t in amm['tokens']:
+            index[t['address']].append(amm_id)
+    return index
+
+
+def create_token_eth_prices(tokens):
+    """Value of one atom in ETH of each token with an external price, as a float."""
+    priced = {t: info for t, info in tokens.items() if info.get('external_price') is not None}
+    return {t: float(eth_per_atom) for t, (_, eth_per_atom) in create_token_valuation_table(priced).items()}
+
+
+def amm_depth_eth(amm, eth_per_atom):
+    """Value in ETH of the balances of an amm, extrapolated from its priced tokens as if
+    all tokens held the same value. None if unknown: the state has no balances (e.g.
+    concentrated liquidity) or none of the tokens has a price."""
+    balances = amm.get('state', {}).get('balances')
+    if balances is None:
+        return None
+    priced = [
+        int(balance) * eth_per_atom[t['address']]
+        for t, balance in zip(amm['tokens'], balances) if t['address'] in eth_per_atom
+    ]
+    if not priced:
+        return None
+    return sum(priced) * len(amm['tokens']) / len(priced)
+
+
+class TokenGraph:
+    """Token adjacency index of an instance's amms, with the depth of each amm in ETH.
+
+    Built once per instance, then answers queries like "amms within 2 hops of (sell, buy)
+    with at least 10 ETH of liquidity" for every order.
+    """
+
+    def __init__(self, amms, tokens):
+        self.amms = amms
+        self.amms_by_token = create_token_amm_index(amms)
+        eth_per_atom = create_token_eth_prices(tokens)
+        self.depth_eth = {amm_id: amm_depth_eth(amm, eth_per_atom) for amm_id, amm in amms.items()}
+
+    def is_deep(self, amm_id, min_depth_eth):
+        depth_eth = self.depth_eth[amm_id]
+        return depth_eth is None or depth_eth >= min_depth_eth
+
+    def reachable_amms(self, tokens, hops, min_depth_eth=0):
+        """Returns the ids of all amms reachable from `tokens` by trading through at most
+        `hops` amms, only trading through amms of unknown depth or at least `min_depth_eth`."""
+        reached = set()
+        visited_tokens = set(tokens)
+        frontier = set(tokens)
+        for _ in range(hops):
+            next_frontier = set()
+            for token in frontier:
+                for amm_id in self.amms_by_token.get(token, ()):
+                    if amm_id in reached or not self.is_deep(amm_id, min_depth_eth):
+                        continue
+                    reached.add(amm_id)
+                    next_frontier.update(t['address'] for t in self.amms[amm_id]['tokens'])
+            frontier = next_frontier - visited_tokens
+            visited_tokens |= next_frontier
+        return reached
+
+
+def create_pruned_single_order_instance(instance, token_graph, o_id, liquidity_orders, hops, min_depth_eth=0):
+    """Single order instance with only the amms within `hops` of the order's sell and buy
+    tokens (through amms of at least `min_depth_eth`), the liquidity orders, and the tokens
+    any of them trade."""
+    order = instance['orders'][o_id]
+    amm_ids = token_graph.reachable_amms({order.sell_token, order.buy_token}, hops, min_depth_eth)
+    amms = {amm_id: instance['amms'][amm_id] for amm_id in amm_ids}
+    orders = {o_id: order, **liquidity_orders}
+
+    token_ids = {NATIVE_TOKEN}
+    for o in orders.values():
+        token_ids.update((o.sell_token, o.buy_token))
+    for amm in amms.values():
+        token_ids.update(t['address'] for t in amm['tokens'])
+
+    return {
+        'tokens': {t: info for t, info in instance['tokens'].items() if t in token_ids},
+        'amms': amms,
+        'orders': orders_to_json(orders),
+        'metadata': instance['metadata'],
+    }
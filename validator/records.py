@@ -0,0 +1,111 @@
+class Order:
+    """Order of an instance, with all amounts parsed to ints once at ingest.
+
+    Instances hold Order records, which are only serialized to the solver json schema
+    (with decimal string amounts) at the boundary, see to_json and instance_to_json.
+    """
+    __slots__ = (
+        'sell_token', 'buy_token', 'sell_amount', 'buy_amount', 'is_sell_order',
+        'is_liquidity_order', 'allow_partial_fill', 'fee_amount', 'fee_token',
+        'cost_amount', 'cost_token', 'mandatory', 'has_atomic_execution', 'is_mandatory',
+    )
+
+    def __init__(self, sell_token, buy_token, sell_amount, buy_amount, is_sell_order,
+                 is_liquidity_order, allow_partial_fill, fee_amount, fee_token,
+                 cost_amount, cost_token, mandatory, has_atomic_execution, is_mandatory=None):
+        self.sell_token = sell_token
+        self.buy_token = buy_token
+        self.sell_amount = sell_amount
+        self.buy_amount = buy_amount
+        self.is_sell_order = is_sell_order
+        self.is_liquidity_order = is_liquidity_order
+        self.allow_partial_fill = allow_partial_fill
+        self.fee_amount = fee_amount
+        self.fee_token = fee_token
+        self.cost_amount = cost_amount
+        self.cost_token = cost_token
+        self.mandatory = mandatory
+        self.has_atomic_execution = has_atomic_execution
+        self.is_mandatory = is_mandatory
+
+    def copy(self, **changes):
+        o = Order.__new__(Order)
+        for slot in Order.__slots__:
+            setattr(o, slot, changes[slot] if slot in changes else getattr(self, slot))
+        return o
+
+    @classmethod
+    def from_json(cls, o):
+        return cls(
+            sell_token=o['sell_token'],
+            buy_token=o['buy_token'],
+            sell_amount=int(o['sell_amount']),
+            buy_amount=int(o['buy_amount']),
+            is_sell_order=o['is_sell_order'],
+            is_liquidity_order=o['is_liquidity_order'],
+            allow_partial_fill=o['allow_partial_fill'],
+            fee_amount=int(o['fee']['amount']),
+            fee_token=o['fee']['token'],
+            cost_amount=int(o['cost']['amount']),
+            cost_token=o['cost']['token'],
+            mandatory=o['mandatory'],
+            has_atomic_execution=o['has_atomic_execution'],
+            is_mandatory=o.get('is_mandatory'),
+        )
+
+    def to_json(self):
+        o = {
+            'buy_token': self.buy_token,
+            'sell_token': self.sell_token,
+            'buy_amount': str(self.buy_amount),
+            'sell_amount': str(self.sell_amount),
+            'is_sell_order': self.is_sell_order,
+            'is_liquidity_order': self.is_liquidity_order,
+            'allow_partial_fill': self.allow_partial_fill,
+            'fee': {'amount': str(self.fee_amount), 'token': self.fee_token},
+            'cost': {'amount': str(self.cost_amount), 'token': self.cost_token},
+            'mandatory': self.mandatory,
+            'has_atomic_execution': self.has_atomic_execution,
+        }
+        if self.is_mandatory is not None:
+            o['is_mandatory'] = self.is_mandatory
+        return o
+
+
+class Execution:
+    """Executed amounts of an order in a solution, and the executed order if known."""
+    __slots__ = ('exec_sell_amount', 'exec_buy_amount', 'order')
+
+    def __init__(self, exec_sell_amount, exec_buy_amount, order=None):
+        self.exec_sell_amount = exec_sell_amount
+        self.exec_buy_amount = exec_buy_amount
+        self.order = order
+
+    @classmethod
+    def from_json(cls, eo):
+        return cls(int(eo['exec_sell_amount']), int(eo['exec_buy_amount']))
+
+    def to_json(self):
+        return {
+            **(self.order.to_json() if self.order is not None else {}),
+            'exec_sell_amount': str(self.exec_sell_amount),
+            'exec_buy_amount': str(self.exec_buy_amount),
+        }
+
+
+def orders_to_json(orders):
+    return {o_id: o.to_json() for o_id, o in orders.items()}
+
+
+def instance_to_json(instance):
+    """Serializes an instance holding Order records to the solver json schema."""
+    return {**instance, 'orders': orders_to_json(instance['orders'])}
+
+
+def solution_to_json(solution):
+    return {**solution, 'orders': orders_to_json(solution['orders'])}
+
+
+def parse_solution(solution):
+    """Parses the executed orders of a solver's json solution into Execution records."""
+    return {**solution, 'orders': {o_id: Execution.from_json(eo) for o_id, eo in solution.get('orders', {}).items()}}
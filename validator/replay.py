@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import logging
+import logging.config
+import os
+import random
+from pathlib import Path
+
+from aiohttp import web
+
+from .cache import MISSING, cache_key
+from .du import DEFAULT_PRUNE_HOPS, compute_auction_disregarded_utility_info
+from .http_client import close_session, response_hooks
+from .profiling import SERVICE_URLS
+from .scheduler import close_solve_scheduler
+from .tokens import get_token_store
+
+logger = logging.getLogger(__name__)
+
+ORDERS_LOOKUP_PATH = '/api/v1/orders/lookup'
+
+
+def exchange_key(method, path, params, body):
+    """Content address of a request, independent of the service's base url."""
+    params = sorted((k, str(v)) for k, v in (params or {}).items())
+    return cache_key('exchange', [method.upper(), path, params, body])
+
+
+def rpc_key(method, params):
+    return exchange_key('RPC', method, None, params)
+
+
+def order_key(uid):
+    return exchange_key('GET', f'/api/v1/orders/{uid}', None, None)
+
+
+def split_service_url(url):
+    """Returns (service, path) of a url of one of the SERVICE_URLS, None otherwise."""
+    for service, env_var in SERVICE_URLS.items():
+        base_url = os.getenv(env_var)
+        if base_url and url.startswith(base_url):
+            return service, url[len(base_url):] or '/'
+    return None
+
+
+class FixtureStore:
+    """Recorded responses of the external services, one <service>.jsonl file of
+    {key, response} lines per service.
+
+    JSON-RPC batches are stored per call and bulk order lookups per order, so they are
+    replayed regardless of how requests were batched when recording.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.responses = {service: {} for service in SERVICE_URLS}
+        for service, responses in self.responses.items():
+            file_path = self.path / f'{service}.jsonl'
+            if file_path.exists():
+                with open(file_path, 'r') as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        responses[entry['key']] = entry['response']
+
+    def get(self, service, key):
+        return self.responses[service].get(key, MISSING)
+
+    def add(self, service, key, response):
+        if self.responses[service].get(key, MISSING) == response:
+            return
+        self.responses[service][key] = response
+        with open(self.path / f'{service}.jsonl', 'a') as f:
+            f.write(json.dumps({'key': key, 'response': response}, separators=(',', ':')) + '\n')
+
+    def record(self, method, url, params, body, response):
+        service_path = split_service_url(url)
+        if service_path is None:
+            return
+        service, path = service_path
+        if service == 'rpc':
+            requests = body if isinstance(body, list) else [body]
+            responses = {r['id']: r for r in (response if isinstance(response, list) else [response])}
+            for request in requests:
+                reply = {k: v for k, v in responses[request['id']].items() if k in ('result', 'error')}
+                self.add(service, rpc_key(request['method'], request['params']), reply)
+        elif service == 'orderbook' and path == ORDERS_LOOKUP_PATH:
+            for order in response:
+                self.add(service, order_key(order['uid']), order)
+        else:
+            self.add(service, exchange_key(method, path, params, body), response)
+
+
+def create_replay_app(service, store, latency=0, jitter=0):
+    """Stand-in for `service` answering recorded requests from `store` after `latency`
+    (plus up to `jitter`) seconds, and unknown requests with 404."""
+
+    async def handle(request):
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+        body = await request.json() if request.can_read_body else None
+
+        if service == 'rpc':
+            def reply(call):
+                response = store.get(service, rpc_key(call['method'], call['params']))
+                if response is MISSING:
+                    response = {'error': {'code': -32000, 'message': 'not recorded'}}
+                return {'jsonrpc': '2.0', 'id': call['id'], **response}
+            return web.json_response([reply(c) for c in body] if isinstance(body, list) else reply(body))
+
+        if service == 'orderbook' and request.path == ORDERS_LOOKUP_PATH:
+            orders = (store.get(service, order_key(uid)) for uid in body)
+            return web.json_response([o for o in orders if o is not MISSING])
+
+        response = store.get(service, exchange_key(request.method, request.path, dict(request.query), body))
+        if response is MISSING:
+            raise web.HTTPNotFound(text=f'{request.method} {request.path_qs} not recorded')
+        return web.json_response(response)
+
+    app = web.Application(client_max_size=2**30)
+    app.router.add_route('*', '/{path:.*}', handle)
+    return app
+
+
+async def start_replay_servers(store, latencies=None, jitter=0, host='127.0.0.1', port=0):
+    """Starts a replay server per service, on consecutive ports from `port` (any free
+    ports if 0). Returns the app runners and the {env var: base url} to point the
+    validator at them."""
+    latencies = latencies or {}
+    runners, urls = [], {}
+    for i, (service, env_var) in enumerate(SERVICE_URLS.items()):
+        runner = web.AppRunner(create_replay_app(service, store, latencies.get(service, 0), jitter))
+        await runner.setup()
+        await web.TCPSite(runner, host, port + i if port else 0).start()
+        runners.append(runner)
+        urls[env_var] = f'http://{host}:{runner.addresses[0][1]}'
+    return runners, urls
+
+
+async def stop_replay_servers(runners):
+    for runner in runners:
+        await runner.cleanup()
+
+
+def parse_latencies(values):
+    """Parses ['service=seconds', ...]."""
+    latencies = {}
+    for value in values:
+        service, seconds = value.split('=')
+        if service not in SERVICE_URLS:
+            raise ValueError(f"Unknown service {service!r}, expected one of {', '.join(SERVICE_URLS)}.")
+        latencies[service] = float(seconds)
+    return latencies
+
+
+async def record(fixture_dir, auction_ids_or_txhashes, settled_orders_only, prune_hops):
+    response_hooks.append(FixtureStore(fixture_dir).record)
+    tokens_path = fixture_dir / 'tokens.json'
+    if tokens_path.exists():
+        get_token_store().load_dump(tokens_path)
+    recorded = []
+    try:
+        for auction_id_or_txhash in auction_ids_or_txhashes:
+            du, instance, _ = await compute_auction_disregarded_utility_info(
+                auction_id_or_txhash, settled_orders_only, None, prune_hops
+            )
+            recorded.append({'auction_id_or_txhash': auction_id_or_txhash, 'nr_orders': len(instance['orders'])})
+            logger.info(f'Recorded {auction_id_or_txhash} ({len(du)} orders solved).')
+    finally:
+        await close_solve_scheduler()
+        await close_session()
+    get_token_store().save_dump(tokens_path)
+    auctions_path = fixture_dir / 'auctions.json'
+    previous = json.loads(auctions_path.read_text()) if auctions_path.exists() else []
+    recorded_ids = {a['auction_id_or_txhash'] for a in recorded}
+    with open(auctions_path, 'w+') as f:
+        json.dump([a for a in previous if a['auction_id_or_txhash'] not in recorded_ids] + recorded, f, indent=2)
+
+
+async def serve(fixture_dir, latencies, jitter, host, port):
+    runners, urls = await start_replay_servers(FixtureStore(fixture_dir), latencies, jitter, host, port)
+    for env_var, url in urls.items():
+        print(f'{env_var}={url}')
+    print(f'TOKEN_METADATA_DUMP={fixture_dir / "tokens.json"}')
+    print('DATA_SOURCES=rpc', flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_replay_servers(runners)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Record responses of the orderbook, LPBook, Quasimodo and the node for a set of auctions, or serve recorded responses from local stand-ins."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Compute disregarded utility of auctions, recording every response.")
+    record_parser.add_argument('fixture_dir', type=Path, help="Directory to add the recorded responses to.")
+    record_parser.add_argument('auction_ids_or_txhashes', type=str, nargs='+', help="Auction ids or transaction hashes.")
+    record_parser.add_argument(
+        '--settled_orders_only',
+        action=argparse.BooleanOptionalAction,
+        help="Compute disregarded utility only for orders that were settled in the solution.",
+        default=True
+    )
+    record_parser.add_argument(
+        '--prune_hops',
+        type=int,
+        default=DEFAULT_PRUNE_HOPS,
+        help="Only send the solver amms reachable from an order's tokens within this many hops. Negative values disable pruning."
+    )
+
+    serve_parser = subparsers.add_parser('serve', help="Serve recorded responses and print the environment pointing at them.")
+    serve_parser.add_argument('fixture_dir', type=Path, help="Directory with recorded responses.")
+    serve_parser.add_argument(
+        '--latency',
+        action='append',
+        default=[],
+        metavar='SERVICE=SECONDS',
+        help=f"Delay responses of a service ({', '.join(SERVICE_URLS)}). Can be repeated."
+    )
+    serve_parser.add_argument('--jitter', type=float, default=0, help="Add up to this many seconds of random delay to every response.")
+    serve_parser.add_argument('--host', type=str, default='127.0.0.1', help="Interface to listen on.")
+    serve_parser.add_argument('--port', type=int, default=0, help="Port of the first service, the others listen on the following ports (default: any free ports).")
+
+    args = parser.parse_args()
+
+    logging.config.fileConfig(fname='logging.conf', disable_existing_loggers=True)
+
+    if args.command == 'record':
+        # Cached responses would not be recorded, and Dune responses cannot be.
+        os.environ['VALIDATOR_CACHE_PATH'] = ''
+        os.environ['DATA_SOURCES'] = 'rpc'
+        asyncio.run(record(args.fixture_dir, args.auction_ids_or_txhashes, args.settled_orders_only, args.prune_hops))
+    else:
+        asyncio.run(serve(args.fixture_dir, parse_latencies(args.latency), args.jitter, args.host, args.port))
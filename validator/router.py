@@ -0,0 +1,149 @@
+import math
+
+import numpy as np
+
+from .exact import order_disregarded_utility
+from .records import Execution
+
+# Fee of the constant product pools the router trades through, by LPBook protocol.
+# LPBook amms carry no fee, so the protocol's fee is used unless the amm has one.
+CONSTANT_PRODUCT_FEES = {
+    'Uniswap_2': 0.003,
+    'Sushiswap_2': 0.003,
+}
+
+# Relative margin added to upper bounds on exchange rates, for the float rounding of
+# reserves and rates.
+RATE_BOUND_MARGIN = 1e-6
+
+
+class ConstantProductRouter:
+    """Best single path routes through the constant product pools of an instance.
+
+    Every pool is stored as two directed edges (token in, token out, reserve in, reserve
+    out, 1 - fee), and routes are relaxed one hop at a time over all edges at once. Pool
+    reserves are floats, so results are estimates, good enough to decide whether an
+    order is worth a solver call.
+    """
+
+    def __init__(self, amms):
+        self.token_index = {}
+        self.nr_amms = 0
+        edges = []
+        for amm in amms.values():
+            fee = CONSTANT_PRODUCT_FEES.get(amm['protocol'])
+            balances = amm['state'].get('balances')
+            if fee is None or balances is None or len(amm['tokens']) != 2:
+                continue
+            fee = float(amm.get('fee', 0)) or fee
+            (t0, t1), (r0, r1) = [t['address'] for t in amm['tokens']], [float(b) for b in balances]
+            if r0 <= 0 or r1 <= 0:
+                continue
+            self.nr_amms += 1
+            i0 = self.token_index.setdefault(t0, len(self.token_index))
+            i1 = self.token_index.setdefault(t1, len(self.token_index))
+            edges += [(i0, i1, r0, r1, 1 - fee), (i1, i0, r1, r0, 1 - fee)]
+
+        edges = np.array(edges, dtype=float).reshape(-1, 5)
+        self.token_in = edges[:, 0].astype(np.intp)
+        self.token_out = edges[:, 1].astype(np.intp)
+        self.reserve_in = edges[:, 2]
+        self.reserve_out = edges[:, 3]
+        self.gamma = edges[:, 4]
+
+    def best_output(self, sell_token, buy_token, sell_amount, hops):
+        """Most atoms of buy_token obtainable for sell_amount atoms of sell_token through
+        at most `hops` pools."""
+        if sell_token not in self.token_index or buy_token not in self.token_index:
+            return 0.0
+        amounts = np.zeros(len(self.token_index))
+        amounts[self.token_index[sell_token]] = sell_amount
+        best = 0.0
+        for _ in range(hops):
+            amount_in = self.gamma * amounts[self.token_in]
+            amount_out = amount_in * self.reserve_out / (self.reserve_in + amount_in)
+            amounts = np.zeros(len(self.token_index))
+            np.maximum.at(amounts, self.token_out, amount_out)
+            best = max(best, amounts[self.token_index[buy_token]])
+        return best
+
+    def best_input(self, sell_token, buy_token, buy_amount, hops):
+        """Fewest atoms of sell_token needed to obtain buy_amount atoms of buy_token
+        through at most `hops` pools, inf if not possible."""
+        if sell_token not in self.token_index or buy_token not in self.token_index:
+            return math.inf
+        amounts = np.full(len(self.token_index), np.inf)
+        amounts[self.token_index[buy_token]] = buy_amount
+        best = math.inf
+        for _ in range(hops):
+            amount_out = amounts[self.token_out]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                amount_in = np.where(
+                    amount_out < self.reserve_out,
+                    self.reserve_in * amount_out / (self.gamma * (self.reserve_out - amount_out)),
+                    np.inf
+                )
+            amounts = np.full(len(self.token_index), np.inf)
+            np.minimum.at(amounts, self.token_in, amount_in)
+            best = min(best, amounts[self.token_index[sell_token]])
+        return best
+
+
+    def max_rate(self, sell_token, buy_token):
+        """Upper bound on the atoms of buy_token obtainable per atom of sell_token,
+        through any number of pools and any split between routes.
+
+        A constant product pool never pays more than its spot rate, so no trade beats
+        the path with the best product of spot rates, found with Bellman-Ford over the
+        logs of the rates. inf if a cycle of spot rates gains, 0 if there is no path.
+        """
+        if sell_token not in self.token_index or buy_token not in self.token_index:
+            return 0.0
+        log_rates = np.log(self.gamma * self.reserve_out / self.reserve_in)
+        best = np.full(len(self.token_index), -np.inf)
+        best[self.token_index[sell_token]] = 0.0
+        for _ in range(len(self.token_index)):
+            relaxed = best.copy()
+            np.maximum.at(relaxed, self.token_out, best[self.token_in] + log_rates)
+            if np.array_equal(relaxed, best):
+                return math.exp(best[self.token_index[buy_token]]) * (1 + RATE_BOUND_MARGIN)
+            best = relaxed
+        return math.inf
+
+
+def create_local_solution(router, o_id, o, eo, hops):
+    """Solution executing order record `o` along its best local route, for its submitted
+    execution `eo` (the full order if not executed). The order is left out if the route
+    does not meet its limit price."""
+    if o.is_sell_order:
+        sell_amount = eo.exec_sell_amount if eo is not None else o.sell_amount
+        buy_amount = int(router.best_output(o.sell_token, o.buy_token, sell_amount, hops))
+    else:
+        buy_amount = eo.exec_buy_amount if eo is not None else o.buy_amount
+        sell_amount = router.best_input(o.sell_token, o.buy_token, buy_amount, hops)
+        if math.isinf(sell_amount):
+            return {'orders': {}}
+        sell_amount = math.ceil(sell_amount)
+    if sell_amount == 0 or buy_amount == 0 or buy_amount * o.sell_amount < sell_amount * o.buy_amount:
+        return {'orders': {}}
+    return {'orders': {o_id: Execution(sell_amount, buy_amount)}}
+
+
+def max_disregarded_utility(router, o, eo):
+    """Upper bound on the disregarded utility of order record `o`, with submitted
+    execution `eo`, in any solution trading only through the router's pools. Returns
+    (token, atoms), inf atoms if unbounded. The solver may leave the order out or fill
+    it up to the submitted or the full amount, all at most at the router's max_rate."""
+    token, du_unfilled = order_disregarded_utility(o, eo, None)
+    rate = router.max_rate(o.sell_token, o.buy_token)
+    if math.isinf(rate):
+        return token, math.inf
+    executions = []
+    if o.is_sell_order:
+        for sell_amount in {o.sell_amount, eo.exec_sell_amount if eo is not None else o.sell_amount}:
+            executions.append(Execution(sell_amount, math.ceil(sell_amount * rate)))
+    elif rate > 0:
+        for buy_amount in {o.buy_amount, eo.exec_buy_amount if eo is not None else o.buy_amount}:
+            executions.append(Execution(math.floor(buy_amount / rate), buy_amount))
+    dus = [order_disregarded_utility(o, eo, eo_f)[1] for eo_f in executions if eo_f.exec_sell_amount > 0]
+    return token, max([du_unfilled, *dus])
@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+from .http_client import is_retryable
+
+logger = logging.getLogger(__name__)
+
+
+class SolveScheduler:
+    """Runs solve jobs on a bounded pool of workers, highest priority first.
+
+    Retryable solver errors (rate limiting, server errors, timeouts) halve the number of
+    jobs allowed to run concurrently and the failed job is retried after an exponential
+    backoff; every success allows one more concurrent job again, up to max_concurrency.
+    Other errors fail the job right away. If max_rate is set, at most max_rate jobs are
+    started per second.
+    """
+
+    def __init__(self, max_concurrency, max_rate=None, max_retries=3, backoff=1.0):
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.min_interval = 1 / max_rate if max_rate else 0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.active = 0
+        self.next_start = 0
+        self.counter = itertools.count()
+        self.loop = None
+        self.workers = []
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.PriorityQueue()
+        self.condition = asyncio.Condition()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.max_concurrency)]
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers, self.loop = [], None
+
+    def submit(self, priority, solve, *args):
+        """Schedules solve(*args) and returns a future of its result."""
+        if self.loop is not asyncio.get_running_loop():
+            self.start()
+        future = self.loop.create_future()
+        self.queue.put_nowait((-priority, next(self.counter), solve, args, future, 0))
+        return future
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.concurrency)
+            self.active += 1
+        if self.min_interval:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.min_interval
+            await asyncio.sleep(start - now)
+
+    async def release(self, error):
+        async with self.condition:
+            self.active -= 1
+            if error is None:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            elif is_retryable(error):
+                self.concurrency = max(1, self.concurrency // 2)
+            self.condition.notify_all()
+
+    async def worker(self):
+        while True:
+            neg_priority, count, solve, args, future, attempt = await self.queue.get()
+            await self.acquire()
+            error = None
+            try:
+                result = await solve(*args)
+            except Exception as err:
+                error = err
+            await self.release(error)
+
+            if future.cancelled():
+                pass
+            elif error is None:
+                future.set_result(result)
+            elif attempt < self.max_retries and is_retryable(error):
+                delay = self.backoff * 2**attempt
+                logger.debug(
+                    f'Solve failed ({error!r}), retrying in {delay:.2f} secs with concurrency {self.concurrency}.'
+                )
+                self.loop.call_later(
+                    delay, self.queue.put_nowait, (neg_priority, count, solve, args, future, attempt + 1)
+                )
+            else:
+                future.set_exception(error)
+
+
+_solve_scheduler = None
+
+
+def get_solve_scheduler():
+    """Returns the process-wide scheduler of solver calls, configured through
+    SOLVER_CONCURRENCY, SOLVER_MAX_RATE, SOLVER_RETRIES and SOLVER_BACKOFF."""
+    global _solve_scheduler
+    if _solve_scheduler is None:
+        max_rate = os.getenv('SOLVER_MAX_RATE')
+        _solve_scheduler = SolveScheduler(
+            max_concurrency=int(os.getenv('SOLVER_CONCURRENCY', 8)),
+            max_rate=float(max_rate) if max_rate else None,
+            max_retries=int(os.getenv('SOLVER_RETRIES', 3)),
+            backoff=float(os.getenv('SOLVER_BACKOFF', 1.0)),
+        )
+    return _solve_scheduler
+
+
+async def close_solve_scheduler():
+    global _solve_scheduler
+    if _solve_scheduler is not None:
+        await _solve_scheduler.close()
+    _solve_scheduler = None
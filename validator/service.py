@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import logging
+import logging.config
+
+from aiohttp import web
+
+from .du import DEFAULT_PRUNE_HOPS, compute_auction_disregarded_utility_info
+from .http_client import close_session
+from .instance_collect import fetch_instance_and_solutions
+from .records import instance_to_json, solution_to_json
+from .scheduler import close_solve_scheduler
+from .sinks import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class DisregardedUtilityJob:
+    """Disregarded utility computation of one auction, shared by all requests for it.
+
+    Records are kept as they are produced, so requests joining late first get the
+    records produced so far and then follow the rest.
+    """
+
+    def __init__(self, auction_id_or_txhash, settled_orders_only, prune_hops):
+        self.records = []
+        self.error = None
+        self.done = False
+        self.changed = asyncio.Condition()
+        self.task = asyncio.create_task(self.run(auction_id_or_txhash, settled_orders_only, prune_hops))
+
+    async def run(self, auction_id_or_txhash, settled_orders_only, prune_hops):
+        def on_record(record):
+            self.records.append(record)
+            asyncio.create_task(self.notify())
+        try:
+            await compute_auction_disregarded_utility_info(
+                auction_id_or_txhash, settled_orders_only, None, prune_hops, on_record
+            )
+        except Exception as err:
+            logger.error(f'Computing disregarded utility for {auction_id_or_txhash} failed: {err!r}')
+            self.error = err
+        self.done = True
+        await self.notify()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def follow(self):
+        """Yields all records of the job, waiting for new ones until it is done."""
+        i = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: i < len(self.records) or self.done)
+            while i < len(self.records):
+                yield self.records[i]
+                i += 1
+            if self.done and i == len(self.records):
+                return
+
+
+def parse_bool(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+async def handle_du(request):
+    auction_id_or_txhash = request.match_info['auction_id_or_txhash']
+    settled_orders_only = parse_bool(request.query.get('settled_orders_only', 'true'))
+    prune_hops = int(request.query.get('prune_hops', DEFAULT_PRUNE_HOPS))
+
+    jobs = request.app['du_jobs']
+    key = (auction_id_or_txhash, settled_orders_only, prune_hops)
+    if key not in jobs:
+        jobs[key] = DisregardedUtilityJob(*key)
+        jobs[key].task.add_done_callback(lambda _: jobs.pop(key, None))
+    job = jobs[key]
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    async for record in job.follow():
+        await response.write((dumps(record) + '\n').encode())
+    if job.error is not None:
+        await response.write((dumps({'error': repr(job.error)}) + '\n').encode())
+    await response.write_eof()
+    return response
+
+
+async def handle_instance(request):
+    auction_id_or_txhash = request.match_info['auction_id_or_txhash']
+
+    pending = request.app['instance_requests']
+    if auction_id_or_txhash not in pending:
+        pending[auction_id_or_txhash] = asyncio.ensure_future(
+            fetch_instance_and_solutions(auction_id_or_txhash, fetch_amms_from_lpbook=True)
+        )
+        pending[auction_id_or_txhash].add_done_callback(lambda _: pending.pop(auction_id_or_txhash, None))
+    try:
+        instance, solutions = await asyncio.shield(pending[auction_id_or_txhash])
+    except Exception as err:
+        raise web.HTTPBadGateway(text=dumps({'error': repr(err)}), content_type='application/json')
+
+    return web.Response(
+        text=dumps({
+            'instance': instance_to_json(instance),
+            'solutions': [solution_to_json(solution) for solution in solutions],
+        }),
+        content_type='application/json',
+    )
+
+
+async def close_clients(app):
+    await close_solve_scheduler()
+    await close_session()
+
+
+def create_app():
+    app = web.Application()
+    app['du_jobs'] = {}
+    app['instance_requests'] = {}
+    app.add_routes([
+        web.post('/du/{auction_id_or_txhash}', handle_du),
+        web.post('/instance/{auction_id_or_txhash}', handle_instance),
+    ])
+    app.on_cleanup.append(close_clients)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve disregarded utility and instance collection over HTTP, keeping caches and connections warm."
+    )
+
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help="Interface to listen on."
+    )
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help="Port to listen on."
+    )
+
+    args = parser.parse_args()
+
+    logging.config.fileConfig(fname='logging.conf', disable_existing_loggers=True)
+
+    web.run_app(create_app(), host=args.host, port=args.port)
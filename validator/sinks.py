@@ -0,0 +1,179 @@
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def finite_or_none(obj):
+    """obj with non-finite floats (e.g. percentages of zero bases) replaced by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: finite_or_none(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [finite_or_none(v) for v in obj]
+    return obj
+
+
+def dumps(obj):
+    """Compact json serialization, through orjson when it is installed. Non-finite
+    floats are written as null either way."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits, which orjson does not serialize
+    try:
+        return json.dumps(obj, separators=(',', ':'), allow_nan=False)
+    except ValueError:
+        return json.dumps(finite_or_none(obj), separators=(',', ':'))
+
+
+def dump(obj, f):
+    f.write(dumps(obj))
+
+
+def column_rows(columns):
+    """Records of a table given as {name: column}, columns being lists or NumPy arrays."""
+    columns = {name: c.tolist() if hasattr(c, 'tolist') else c for name, c in columns.items()}
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def to_decimal_strings(column):
+    return [str(value) if value is not None else None for value in column]
+
+
+class JsonlSink:
+    """Writes one json record per line, flushing after each record."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(dumps(record) + '\n')
+        self.f.flush()
+
+    def write_columns(self, columns):
+        self.f.write(''.join(dumps(record) + '\n' for record in column_rows(columns)))
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class CsvSink:
+    """Appends records to a csv file, writing the header only if the file is new."""
+
+    def __init__(self, path):
+        self.is_new = not Path(path).exists() or Path(path).stat().st_size == 0
+        self.f = open(path, 'a', newline='')
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.f, fieldnames=list(record.keys()), extrasaction='ignore')
+            if self.is_new:
+                self.writer.writeheader()
+        self.writer.writerow(record)
+        self.f.flush()
+
+    def write_columns(self, columns):
+        for record in column_rows(columns):
+            self.write(record)
+
+    def close(self):
+        self.f.close()
+
+
+# Arrow types of the field types of ParquetSink. Decimal fields are python ints, which
+# may exceed 64 bits, and are written as decimal strings.
+ARROW_TYPES = {'string': 'string', 'int': 'int64', 'float': 'float64', 'bool': 'bool_', 'decimal': 'string'}
+
+
+class ParquetSink:
+    """Appends records to a directory of parquet files, one new file per run, written
+    in row groups of batch_size records. Requires pyarrow.
+
+    All row groups of a file share one schema: given `fields`, [(name, type)] with types
+    of ARROW_TYPES, or inferred from the first records written otherwise.
+    """
+
+    def __init__(self, path, batch_size=1000, fields=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise RuntimeError("Writing parquet files requires pyarrow to be installed.") from err
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.path = Path(path) / f'part-{int(time.time())}-{os.getpid()}.parquet'
+        self.batch_size = batch_size
+        self.decimal_columns = {name for name, t in fields or () if t == 'decimal'}
+        self.schema = pyarrow.schema([
+            (name, getattr(pyarrow, ARROW_TYPES[t])()) for name, t in fields
+        ]) if fields is not None else None
+        self.records = []
+        self.writer = None
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def write_columns(self, columns):
+        """Writes a table given as {name: list or NumPy array} as is, without going
+        through per record dicts."""
+        self.flush()
+        self.write_table(columns)
+
+    def flush(self):
+        if not self.records:
+            return
+        names = self.schema.names if self.schema is not None else list(self.records[0])
+        self.write_table({name: [record.get(name) for record in self.records] for name in names})
+        self.records = []
+
+    def write_table(self, columns):
+        if not columns or len(next(iter(columns.values()))) == 0:
+            return
+        table = self.pa.table({
+            name: to_decimal_strings(column) if name in self.decimal_columns else column
+            for name, column in columns.items()
+        }, schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pq.ParquetWriter(str(self.path), self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def create_sink(path, fields=None):
+    """Sink for the file at `path` ('-' for stdout), in jsonl, csv or parquet format
+    depending on the suffix. `fields` are the typed columns of parquet files, see
+    ParquetSink."""
+    if str(path) == '-':
+        return JsonlSink(sys.stdout)
+    suffix = Path(path).suffix
+    if suffix == '.csv':
+        return CsvSink(path)
+    if suffix == '.parquet':
+        return ParquetSink(path, fields=fields)
+    if suffix in ('.jsonl', '.json'):
+        return JsonlSink(open(path, 'a'))
+    raise ValueError(f"Unsupported output file type: {path}")
@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+
+from eth_hash.auto import keccak
+
+# Decoders of swap event logs, by event topic (topic0).
+swap_decoders = {}
+
+
+def event_topic(event_signature):
+    return '0x' + keccak(event_signature.encode()).hex()
+
+
+def function_selector(function_signature):
+    return '0x' + keccak(function_signature.encode())[:4].hex()
+
+
+def decode_words(data):
+    data = data[2:]
+    return [int(data[i:i + 64], 16) for i in range(0, len(data), 64)]
+
+
+def to_signed(word):
+    return word - 2**256 if word >= 2**255 else word
+
+
+def decode_address(word):
+    return '0x' + word[-40:].lower()
+
+
+TOKEN0_CALL = function_selector('token0()')
+TOKEN1_CALL = function_selector('token1()')
+
+
+class SwapDecoder(ABC):
+    """Decodes the logs of one swap event into (pool address, swap).
+
+    Swaps are seen from the pool's side: the pool buys `exec_buy_amount` of `buy_token`
+    and sells `exec_sell_amount` of `sell_token`. Decoders that need immutable contract
+    data, e.g. a pair's tokens, list the (address, calldata) eth_calls in `calls`, and
+    get their results in `decode`.
+    """
+    event_signature = None
+    kind = None
+
+    @property
+    def topic(self):
+        return event_topic(self.event_signature)
+
+    def calls(self, log):
+        return []
+
+    @abstractmethod
+    def decode(self, log, call_results):
+        pass
+
+
+def register_swap_decoder(decoder):
+    swap_decoders[decoder.topic] = decoder
+    return decoder
+
+
+def create_swap(kind, buy_token, sell_token, exec_buy_amount, exec_sell_amount, **extra):
+    return {
+        'kind': kind,
+        'buy_token': buy_token,
+        'sell_token': sell_token,
+        'exec_buy_amount': exec_buy_amount,
+        'exec_sell_amount': exec_sell_amount,
+        **extra,
+    }
+
+
+class UniswapV2SwapDecoder(SwapDecoder):
+    event_signature = 'Swap(address,uint256,uint256,uint256,uint256,address)'
+    kind = 'uniswap_v2'
+
+    def calls(self, log):
+        address = log['address'].lower()
+        return [(address, TOKEN0_CALL), (address, TOKEN1_CALL)]
+
+    def decode(self, log, call_results):
+        address = log['address'].lower()
+        token0 = decode_address(call_results[address, TOKEN0_CALL])
+        token1 = decode_address(call_results[address, TOKEN1_CALL])
+        amount0_in, amount1_in, amount0_out, amount1_out = decode_words(log['data'])
+        if amount0_in > 0:
+            return address, create_swap(self.kind, token0, token1, amount0_in, amount1_out)
+        return address, create_swap(self.kind, token1, token0, amount1_in, amount0_out)
+
+
+class UniswapV3SwapDecoder(UniswapV2SwapDecoder):
+    event_signature = 'Swap(address,address,int256,int256,uint160,uint128,int24)'
+    kind = 'uniswap_v3'
+
+    def decode(self, log, call_results):
+        address = log['address'].lower()
+        token0 = decode_address(call_results[address, TOKEN0_CALL])
+        token1 = decode_address(call_results[address, TOKEN1_CALL])
+        amount0, amount1, sqrt_price, liquidity, tick = decode_words(log['data'])
+        amount0, amount1 = to_signed(amount0), to_signed(amount1)
+        # State of the pool after the swap.
+        state = {'sqrt_price': str(sqrt_price), 'liquidity': str(liquidity), 'tick': to_signed(tick)}
+        if amount0 > 0:
+            return address, create_swap(self.kind, token0, token1, amount0, -amount1, state=state)
+        return address, create_swap(self.kind, token1, token0, amount1, -amount0, state=state)
+
+
+class BalancerV2SwapDecoder(SwapDecoder):
+    """Swaps are emitted by the vault, the pool address is the prefix of the pool id."""
+    event_signature = 'Swap(bytes32,address,address,uint256,uint256)'
+    kind = 'balancer_v2'
+
+    def decode(self, log, call_results):
+        address = '0x' + log['topics'][1][2:42].lower()
+        token_in = decode_address(log['topics'][2])
+        token_out = decode_address(log['topics'][3])
+        amount_in, amount_out = decode_words(log['data'])
+        return address, create_swap(self.kind, token_in, token_out, amount_in, amount_out)
+
+
+class CurveSwapDecoder(SwapDecoder):
+    """Curve events only carry coin indices, which are kept so reserves can be updated
+    by index; the token addresses are left unresolved."""
+    event_signature = 'TokenExchange(address,int128,uint256,int128,uint256)'
+    kind = 'curve'
+
+    def decode(self, log, call_results):
+        address = log['address'].lower()
+        sold_id, tokens_sold, bought_id, tokens_bought = decode_words(log['data'])
+        sold_id, bought_id = to_signed(sold_id), to_signed(bought_id)
+        return address, create_swap(
+            self.kind, None, None, tokens_sold, tokens_bought,
+            buy_token_index=sold_id, sell_token_index=bought_id,
+        )
+
+
+register_swap_decoder(UniswapV2SwapDecoder())
+register_swap_decoder(UniswapV3SwapDecoder())
+register_swap_decoder(BalancerV2SwapDecoder())
+register_swap_decoder(CurveSwapDecoder())
@@ -0,0 +1,106 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+from pathlib import Path
+
+from .cache import MISSING, cache_key, get_cache
+from .dune import create_dune_query, get_dune_connection
+from .profiling import record_cache
+from .util import traced
+
+logger = logging.getLogger(__name__)
+
+
+@traced(logger, 'Backfilling token metadata through Dune.')
+async def fetch_erc20_tokens_from_dune(token_addresses):
+    token_sql = ",".join(f"'\\{t[1:]}'" for t in token_addresses)
+    raw_sql = f"select * from erc20.tokens where contract_address in ({token_sql})"
+    query = create_dune_query(raw_sql)
+    dune_connection = get_dune_connection()
+    data = await asyncio.to_thread(
+        dune_connection.fetch,
+        query,
+    )
+    return {
+        '0' + t['contract_address'][1:]: {'symbol': t['symbol'], 'decimals': t['decimals']}
+        for t in data
+    }
+
+
+class TokenStore:
+    """Memory resident index of token metadata ({'symbol', 'decimals'}) by token address.
+
+    Known tokens are answered from memory, then from the persistent cache, and all
+    remaining addresses of a lookup are backfilled with a single Dune query. Concurrent
+    lookups of the same unknown token share one backfill.
+    """
+
+    def __init__(self):
+        self.tokens = {}
+        self.pending = {}
+
+    def load_dump(self, path):
+        """Pre-seeds the index from a json object {address: {symbol, decimals}} or a
+        csv file with address, symbol and decimals columns."""
+        path = Path(path)
+        with open(path, 'r') as f:
+            if path.suffix == '.csv':
+                rows = {r['address']: r for r in csv.DictReader(f)}
+            else:
+                rows = json.load(f)
+        for address, row in rows.items():
+            self.tokens[address.lower()] = {'symbol': row['symbol'], 'decimals': int(row['decimals'])}
+        logger.debug(f'Loaded metadata of {len(rows)} tokens from {path}.')
+
+    def save_dump(self, path):
+        with open(path, 'w+') as f:
+            json.dump({t: m for t, m in self.tokens.items() if m is not None}, f, separators=(',', ':'))
+
+    async def backfill(self, token_addresses):
+        cache = get_cache()
+        found = {}
+        if cache is not None:
+            for t in token_addresses:
+                metadata = cache.get(cache_key('token_metadata', t))
+                if metadata is not MISSING:
+                    found[t] = metadata
+        missing = [t for t in token_addresses if t not in found]
+        if missing:
+            fetched = await fetch_erc20_tokens_from_dune(missing)
+            # Tokens unknown to Dune are cached as None, so they are not queried again.
+            if cache is not None:
+                for t in missing:
+                    cache.set(cache_key('token_metadata', t), fetched.get(t))
+            found.update(fetched)
+        for t in token_addresses:
+            self.tokens[t] = found.get(t)
+
+    async def get(self, token_addresses):
+        """Returns {address: metadata} for all given addresses with known metadata."""
+        token_addresses = [t.lower() for t in token_addresses]
+        unknown = [t for t in token_addresses if t not in self.tokens and t not in self.pending]
+        for t in token_addresses:
+            record_cache('token_store', t in self.tokens)
+        if unknown:
+            backfill = asyncio.ensure_future(self.backfill(unknown))
+            for t in unknown:
+                self.pending[t] = backfill
+            backfill.add_done_callback(lambda _: [self.pending.pop(t, None) for t in unknown])
+        await asyncio.gather(*{self.pending[t] for t in token_addresses if t in self.pending})
+        return {t: self.tokens[t] for t in token_addresses if self.tokens.get(t) is not None}
+
+
+_token_store = None
+
+
+def get_token_store():
+    """Returns the process-wide token store, pre-seeded from TOKEN_METADATA_DUMP if set."""
+    global _token_store
+    if _token_store is None:
+        _token_store = TokenStore()
+        dump_path = os.getenv('TOKEN_METADATA_DUMP')
+        if dump_path:
+            _token_store.load_dump(dump_path)
+    return _token_store
@@ -5,14 +5,20 @@ import functools
 import time
 from contextlib import contextmanager
 
-from frozendict import frozendict
+from . import profiling
 
 
 @contextmanager
-def traced_context(logger, description):
+def traced_context(logger, description, stage=None):
+    """Logs the run time of the block, and records it as a span of `stage` (by default
+    the description) if profiling is enabled."""
     start_time = time.perf_counter()
     logger.debug(f'{description} ...')
-    yield
+    if profiling.profiler is None:
+        yield
+    else:
+        with profiling.profiler.span(stage or description):
+            yield
     end_time = time.perf_counter()
     run_time = end_time - start_time
     logger.debug(f'{description} ... done ({run_time:.4f} secs)')
@@ -50,11 +56,3 @@ def traced(logger, description=None):
 
     return traced_decorator
 
-
-def freeze_dicts(d):
-    if isinstance(d, dict):
-        r = {}
-        for k, v in d.items():
-            r[freeze_dicts(k)] = freeze_dicts(v)
-        return frozendict(r)
-    return d
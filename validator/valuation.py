@@ -0,0 +1,117 @@
+import numpy as np
+
+from .exact import create_token_valuation_table, round_fraction
+from .sinks import column_rows
+
+# Columns of a disregarded utility table, in the order of the per order records.
+DU_COLUMNS = (
+    'token', 'du', 'du_dec', 'du_ETH', 'du_perc', 'surplus', 'surplus_dec', 'surplus_ETH', 'surplus_perc', 'order_id',
+    'estimated',
+)
+
+
+# Fields of the records of DisregardedUtilityTable.record_columns, in order, with their
+# types for typed sinks (see sinks.ParquetSink). Token amounts in atoms are decimals.
+RECORD_FIELDS = (
+    ('auction_id_or_txhash', 'string'),
+    ('txhash', 'string'),
+    ('block_number', 'int'),
+    ('solver', 'string'),
+    ('solution_index', 'int'),
+    ('token_alias', 'string'),
+    ('token', 'string'),
+    ('du', 'decimal'),
+    ('du_dec', 'float'),
+    ('du_ETH', 'float'),
+    ('du_perc', 'float'),
+    ('surplus', 'decimal'),
+    ('surplus_dec', 'float'),
+    ('surplus_ETH', 'float'),
+    ('surplus_perc', 'float'),
+    ('order_id', 'string'),
+    ('estimated', 'bool'),
+)
+
+
+class TokenValuationColumns:
+    """Decimals unit and ETH value of one atom of each token of an instance, as arrays
+    indexed by token position, built once per instance."""
+
+    def __init__(self, tokens):
+        token_table = create_token_valuation_table(tokens)
+        self.token_index = {t: i for i, t in enumerate(token_table)}
+        self.token_unit = np.array([float(unit) for unit, _ in token_table.values()])
+        self.eth_per_atom = np.array([float(eth_per_atom) for _, eth_per_atom in token_table.values()])
+
+
+def percentages(amounts, bases):
+    """Vectorized exact.percentage: amounts as percentages of bases, +-inf for non-zero
+    amounts of zero bases."""
+    zero_base = np.where(amounts != 0, np.copysign(np.inf, amounts), 0.0)
+    return np.where(bases != 0, 100 * amounts / np.where(bases != 0, bases, 1), zero_base)
+
+
+class DisregardedUtilityTable:
+    """Disregarded utility and surplus of the orders of a solution, one column per field
+    of compute_order_disregarded_utility_info. Iterating yields one record per order.
+
+    Token amounts rounded to atoms are kept as lists of python ints, which may exceed 64
+    bits; all other columns are float arrays, except order ids, tokens and whether the
+    order's solution is only a local estimate (`estimated`).
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['order_id'])
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def rows(self):
+        return column_rows({name: self.columns[name] for name in DU_COLUMNS})
+
+    def total(self, name):
+        return float(np.sum(self.columns[name]))
+
+    def record_columns(self, auction_id_or_txhash, instance, solution):
+        """Columns of the flat, machine readable records of the orders, identifying the
+        auction and solution, e.g. for Sink.write_columns."""
+        constants = {
+            'auction_id_or_txhash': auction_id_or_txhash,
+            'txhash': instance['metadata']['txhash'],
+            'block_number': instance['metadata'].get('block_number'),
+            'solver': solution['metadata']['solver'],
+            'solution_index': solution['metadata']['index'],
+        }
+        return {
+            **{name: [value] * len(self) for name, value in constants.items()},
+            'token_alias': [instance['tokens'][t]['alias'] for t in self.columns['token']],
+            **self.columns,
+        }
+
+
+def create_disregarded_utility_table(valuation, order_ids, tokens, dus, surpluses, exec_buy_amounts, estimated=None):
+    """Values the exact disregarded utilities and surpluses (Fractions of atoms of the
+    given tokens) of many orders at once. `valuation` are the TokenValuationColumns of
+    the instance."""
+    token_positions = np.array([valuation.token_index[t] for t in tokens], dtype=np.intp)
+    token_unit = valuation.token_unit[token_positions]
+    eth_per_atom = valuation.eth_per_atom[token_positions]
+    du = np.array([float(d) for d in dus], dtype=float)
+    surplus = np.array([float(s) for s in surpluses], dtype=float)
+    exec_buy_amount = np.array([float(a) for a in exec_buy_amounts], dtype=float)
+    return DisregardedUtilityTable({
+        'token': list(tokens),
+        'du': [round_fraction(d) for d in dus],
+        'du_dec': du / token_unit,
+        'du_ETH': du * eth_per_atom,
+        'du_perc': percentages(du, exec_buy_amount),
+        'surplus': [round_fraction(s) for s in surpluses],
+        'surplus_dec': surplus / token_unit,
+        'surplus_ETH': surplus * eth_per_atom,
+        'surplus_perc': percentages(surplus, exec_buy_amount),
+        'order_id': list(order_ids),
+        'estimated': list(estimated) if estimated is not None else [False] * len(order_ids),
+    })
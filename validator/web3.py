@@ -1,62 +1,117 @@
-
 import json
 import os
-from pathlib import Path
+from statistics import median
 from dotenv import load_dotenv
-from web3 import Web3
 import logging
+from .cache import MISSING, cache_key, get_cache, persistent_cache
+from .http_client import HttpError, post_json
+from .swap_decoders import swap_decoders
 from .util import traced
-import warnings
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-w3 = Web3(Web3.HTTPProvider(os.getenv('WEB3_URL')))
 
-def get_lp_uni_v2_swaps(txhash, w3):
-    # uni v2
-    with open(Path(__file__).parent /'./artifacts/uniswap_v2_pair.abi', 'r') as f:
-        contract_abi = json.load(f)
+async def rpc_batch(calls):
+    """Sends [(method, params), ...] as a single JSON-RPC batch, returns the results in order."""
+    if not calls:
+        return []
+    payload = [
+        {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    web3_url = os.getenv('WEB3_URL')
+    responses = await post_json(web3_url, json=payload)
+    # Nodes reply to batches they reject as a whole (e.g. too large) with a single error.
+    if not isinstance(responses, list):
+        raise HttpError('POST', web3_url, 200, json.dumps(responses))
+    responses = {r.get('id'): r for r in responses}
+    results = []
+    for i, (method, _) in enumerate(calls):
+        if i not in responses:
+            raise HttpError('POST', web3_url, 200, f"No response to {method} in batch reply")
+        if 'error' in responses[i]:
+            raise RuntimeError(f"Error calling {method} through web3: {responses[i]['error']}")
+        results.append(responses[i]['result'])
+    return results
 
-    UniV2 = w3.eth.contract(abi=contract_abi)
 
-    receipt = w3.eth.getTransactionReceipt(txhash)
-    swaps = {}
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        swap_events = UniV2.events.Swap().processReceipt(receipt)
-
-    for swap_event in swap_events:
-        address = swap_event['address']
-
-        token0 = UniV2(address).functions.token0().call().lower()
-        token1 = UniV2(address).functions.token1().call().lower()
-
-        if address not in swaps.keys():
-            swaps[address.lower()] = []
-        if swap_event['args']['amount0In'] > 0:
-            swaps[address.lower()].append({
-                'buy_token': token0,
-                'sell_token': token1,
-                'exec_buy_amount': int(swap_event['args']['amount0In']),
-                'exec_sell_amount': int(swap_event['args']['amount1Out']),
-            })
+async def rpc_call(method, params):
+    response = await post_json(
+        os.getenv('WEB3_URL'), json={'jsonrpc': '2.0', 'id': 0, 'method': method, 'params': params}
+    )
+    if 'error' in response:
+        raise RuntimeError(f"Error calling {method} through web3: {response['error']}")
+    return response['result']
+
+
+# Results of immutable contract calls (e.g. a pair's tokens) by (address, calldata).
+call_results = {}
+
+
+async def get_call_results(calls):
+    """Returns {(address, calldata): result} of eth_calls whose results never change,
+    resolving unknown calls with one JSON-RPC batch."""
+    cache = get_cache()
+    missing = []
+    for call in set(calls):
+        if call in call_results:
+            continue
+        result = cache.get(cache_key('contract_call', call)) if cache is not None else MISSING
+        if result is MISSING:
+            missing.append(call)
         else:
-            swaps[address.lower()].append({
-                'buy_token': token1,
-                'sell_token': token0,
-                'exec_buy_amount': int(swap_event['args']['amount1In']),
-                'exec_sell_amount': int(swap_event['args']['amount0Out']),
-            })
+            call_results[call] = result
+
+    results = await rpc_batch([
+        ('eth_call', [{'to': address, 'data': data}, 'latest']) for address, data in missing
+    ])
+    for call, result in zip(missing, results):
+        call_results[call] = result
+        if cache is not None:
+            cache.set(cache_key('contract_call', call), result)
+
+    return {call: call_results[call] for call in calls}
+
+
+async def decode_lp_swaps(logs):
+    """Decodes all swap events in `logs` with a registered decoder into
+    {pool address: [swap, ...]}, in one pass over the logs."""
+    decodable = [
+        (swap_decoders[log['topics'][0]], log)
+        for log in logs if log['topics'] and log['topics'][0] in swap_decoders
+    ]
+    results = await get_call_results([call for decoder, log in decodable for call in decoder.calls(log)])
+
+    swaps = {}
+    for decoder, log in decodable:
+        address, swap = decoder.decode(log, results)
+        swaps.setdefault(address, []).append(swap)
     return swaps
 
+
+@persistent_cache('pool_swaps', key=lambda txhash: txhash.lower())
 @traced(logger, 'Getting public pool swaps through web3.')
-def get_lp_swaps(txhash):
-    # uni v2
-    swaps_univ2 = get_lp_uni_v2_swaps(txhash, w3)
-    return swaps_univ2
+async def get_lp_swaps(txhash):
+    receipt = await rpc_call('eth_getTransactionReceipt', [txhash])
+    return await decode_lp_swaps(receipt['logs'])
+
 
 @traced(logger, 'Getting block number from txhash through web3.')
-def get_block_number_from_txhash(txhash):
-    return w3.eth.get_transaction(txhash)['blockNumber']
+async def get_block_number_from_txhash(txhash):
+    return int((await rpc_call('eth_getTransactionByHash', [txhash]))['blockNumber'], 16)
+
+
+@traced(logger, 'Getting gas price from block number through web3.')
+async def get_gas_price_from_block_number(block_number):
+    """Median gas price of the transactions in the block."""
+    block = await rpc_call('eth_getBlockByNumber', [hex(block_number), True])
+    return median(int(tx['gasPrice'], 16) for tx in block['transactions'])
+
+
+@traced(logger, 'Getting touched public pools through web3.')
+async def get_touched_lps(txhash, lps):
+    receipt = await rpc_call('eth_getTransactionReceipt', [txhash])
+    emitters = {log['address'].lower() for log in receipt['logs']}
+    return [lp['address'] for lp in lps if lp['address'].lower() in emitters]